@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+# CAN acquisition: the bus, the request loop and the decoding, without Kivy.
+#
+# The dashboards run it on threads of the UI process, or with CAR_MULTIPROCESS=1
+# in a child process of its own (AcquisitionProcess), so that rendering and bus
+# timing do not share a GIL. The child owns the bus, the scheduler, the decoding,
+# the trip computer and the recorders; the values that pass SignalState are
+# written to a sharedring file that the UI reads once per frame (RingStore). The
+# UI restarts the child when it exits, the child exits when the UI is gone.
+#
+#   python acquisition.py <ring file>       the child, started by AcquisitionProcess
+
+import os
+import signal as signals
+import subprocess
+import sys
+import tempfile
+import time
+from threading import Thread
+
+from decoders import registry, ecus, HOUR_MINUTE, NEGATIVE_RESPONSE
+from signalstore import SignalStore, SignalState
+from scheduler import PollScheduler
+from isotp import IsoTpChannel, SINGLE_FRAME
+from history import HistoryWriter
+from sharedring import RingWriter, RingReader
+from tripcomputer import TripComputer, OUTPUTS as TRIP_OUTPUTS
+
+# CAR_HISTORY=<dir> records every value change of the numeric signals, written every CAR_HISTORY_FLUSH s
+history_dir = os.environ.get('CAR_HISTORY')
+history_flush = float(os.environ.get('CAR_HISTORY_FLUSH', '60'))
+
+# CAR_SHARED_RING=<file> publishes every decoded value to other local processes (see sharedring.py),
+# CAR_SHARED_RING_SIZE records are kept for slow readers
+shared_ring_file = os.environ.get('CAR_SHARED_RING')
+shared_ring_size = int(os.environ.get('CAR_SHARED_RING_SIZE', '4096'))
+
+# every value that can be published: the ECU signals and the trip computer outputs
+RING_NAMES = [signal.name for signal in registry] + sorted(TRIP_OUTPUTS)
+
+scheduler = PollScheduler(registry.poll_groups())
+
+# python-can and the modules using it are imported by open_bus()
+can = None
+bus = None
+journal = None
+
+
+def open_bus():
+    global can, bus, journal
+    import can
+    from journal import FrameJournal, ReplayBus
+    from simulator import VirtualEcu, CYCLES
+
+    # CAR_REPLAY=<journal> [CAR_REPLAY_SPEED=<factor>, 0 = as fast as possible] replaces can0 with a recording
+    if os.environ.get('CAR_REPLAY'):
+        bus = ReplayBus(os.environ['CAR_REPLAY'], speed=float(os.environ.get('CAR_REPLAY_SPEED', '1')))
+    else:
+        # CAR_SIMULATOR=<drive cycle> answers the requests with an in-process virtual ECU
+        simulator_cycle = os.environ.get('CAR_SIMULATOR')
+        interface = os.environ.get('CAR_INTERFACE', 'virtual' if simulator_cycle else 'socketcan')
+        channel = os.environ.get('CAR_CHANNEL', 'can0')
+        bus = can.interface.Bus(channel=channel, bustype=interface, can_filters=registry.can_filters())
+        if simulator_cycle:
+            VirtualEcu(can.interface.Bus(channel=channel, bustype=interface), CYCLES[simulator_cycle]).start()
+
+    # CAR_JOURNAL=<file> records every request and response
+    journal = FrameJournal(os.environ['CAR_JOURNAL']) if os.environ.get('CAR_JOURNAL') else None
+
+
+def open_recorders():
+    # (history, ring) configured by the environment, None when off
+    history = ring = None
+    if history_dir:
+        numeric = [signal.name for signal in registry if signal.layout is not HOUR_MINUTE]
+        history = HistoryWriter(history_dir, numeric, history_flush)
+    if shared_ring_file:
+        ring = RingWriter(shared_ring_file, RING_NAMES, shared_ring_size)
+    return history, ring
+
+
+def send_frame(arbitration_id, data):
+    bus.send(can.Message(arbitration_id=arbitration_id, data=data, extended_id=False))
+    if journal is not None:
+        journal.record_sent(arbitration_id, data)
+
+
+# ISO-TP channel of every ECU, keyed by response id
+channels = dict((response_id, IsoTpChannel(send_frame, request_id, response_id))
+                for request_id, response_id in ecus.items())
+
+
+class CanListener(object):
+    # A can.Listener without importing python-can at startup, the Notifier only calls it.
+    # `scheduler` is told about every response, the PollScheduler or the AsyncCanEngine.
+    # `history` gets the values passed to the store, `ring` every decoded sample.
+    def __init__(self, store, scheduler, monitor=None, history=None, ring=None):
+        self.store = store
+        self.scheduler = scheduler
+        self.monitor = monitor
+        self.history = history
+        self.ring = ring
+        self.states = dict((signal.name, SignalState(signal.deadband, signal.min_interval)) for signal in registry)
+        # fed every sample, its outputs are handled like the ECU signals
+        self.trip = TripComputer(self.derived)
+
+    def on_message_received(self, message):
+        monitor = self.monitor
+        if monitor is not None:
+            received = time.monotonic()
+        data = message.data
+        response_id = message.arbitration_id
+        if data[0] >> 4 == SINGLE_FRAME:
+            if data[1] == NEGATIVE_RESPONSE:
+                self.scheduler.negative_response(response_id, data[2], data[3])
+                return
+            # the common case, decoded straight from the frame
+            decoded = registry.decode_payload(response_id, data, 1, 1 + (data[0] & 0x0F))
+        else:
+            channel = channels.get(response_id)
+            payload = channel.on_frame(data) if channel is not None else None
+            if payload is None:
+                return
+            decoded = registry.decode_payload(response_id, payload, 0, len(payload))
+
+        now = time.monotonic()
+        trip = self.trip
+        history = self.history
+        ring = self.ring
+        for signal, value in decoded:
+            trip.add(signal.name, value, now)
+            if ring is not None:
+                ring.publish(signal.name, value)
+            if self.states[signal.name].update(value, now):
+                self.store.set(signal.name, value, now)
+                if history is not None:
+                    history.add(signal.name, value)
+            if monitor is not None:
+                monitor.response_received(signal.name, received, time.monotonic())
+            self.scheduler.response_received(signal.name)
+
+    __call__ = on_message_received
+
+    def derived(self, name, value):
+        self.store.set(name, value)
+        if self.ring is not None:
+            self.ring.publish(name, value)
+
+
+class RequestsLoop(Thread):
+    def __init__(self, monitor=None):
+        Thread.__init__(self)
+        self.daemon = True
+        self.monitor = monitor
+        self.start()
+
+    def run(self):
+        # poll every group at its own rate, the next request goes out once the ECU has answered
+        monitor = self.monitor
+        while True:
+            group = scheduler.next_due()
+            scheduler.request_sent(group)
+            if monitor is not None:
+                monitor.request_sent(group)
+            try:
+                if not channels[group.response_id].send(group.request):
+                    scheduler.request_failed(group)
+            except:
+                pass
+            scheduler.wait_response()
+
+
+def start(store, monitor=None):
+    # opens the bus and runs the Notifier and the RequestsLoop threads, returns the history writer
+    history, ring = open_recorders()
+    open_bus()
+    listener = CanListener(store, scheduler, monitor, history, ring)
+    can.Notifier(bus, [listener] if journal is None else [listener, journal])
+    RequestsLoop(monitor)
+    return history
+
+
+class RingStore(SignalStore):
+    # SignalStore of the UI process with CAR_MULTIPROCESS=1, take_changed() first
+    # reads what the acquisition process published since the previous frame
+    def __init__(self, path):
+        SignalStore.__init__(self)
+        self.path = path
+        self.reader = None
+
+    def take_changed(self):
+        reader = self.reader
+        if reader is None or reader.replaced():
+            # not started yet or restarted, the new process sends every value again
+            reader = self.reader = self._open()
+        if reader is not None:
+            for timestamp, name, value in reader.read():
+                self.set(name, value, timestamp)
+        return SignalStore.take_changed(self)
+
+    def _open(self):
+        try:
+            return RingReader(self.path, from_start=True)
+        except (IOError, OSError, ValueError):
+            return None
+
+
+class AcquisitionProcess(object):
+    # Runs `python acquisition.py <ring file>` with the environment of the UI and
+    # starts it again, at most every `restart_delay` seconds, when it exits.
+    # check() is called periodically from the UI.
+    def __init__(self, path=None, restart_delay=1.0):
+        if path is None:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            path = os.path.join(directory, 'car_acquisition_%d' % os.getpid())
+        self.path = path
+        self.restart_delay = restart_delay
+        self.restarts = 0
+        self.process = None
+        self._started = None
+
+    def start(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'acquisition.py')
+        self.process = subprocess.Popen([sys.executable, script, self.path])
+        self._started = time.monotonic()
+
+    def check(self, *args):
+        code = self.process.poll()
+        if code is None or time.monotonic() - self._started < self.restart_delay:
+            return
+        self.restarts += 1
+        print('acquisition process exited with %s, restarting (%d)' % (code, self.restarts))
+        self.start()
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class RingPublisher(object):
+    # The store of the acquisition process: values go to the UI through the ring.
+    # Unlike CAR_SHARED_RING its records carry time.monotonic(), CLOCK_MONOTONIC is
+    # the same clock in every process on Linux, so RingStore keeps the receive time.
+    def __init__(self, writer):
+        self.writer = writer
+
+    def set(self, name, value, timestamp=None):
+        self.writer.publish(name, value, time.monotonic() if timestamp is None else timestamp)
+
+
+def main():
+    if len(sys.argv) != 2:
+        print('usage: python acquisition.py <ring file>')
+        sys.exit(1)
+    parent = os.getppid()
+    # SIGTERM from AcquisitionProcess.stop() unwinds through the finally below
+    signals.signal(signals.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    path = sys.argv[1]
+    history = start(RingPublisher(RingWriter(path, RING_NAMES)))
+    try:
+        while os.getppid() == parent:
+            time.sleep(1)
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        if history is not None:
+            history.stop()
+        if journal is not None:
+            journal.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+# Texture atlases for the dashboard images.
+#
+# The source PNGs stay in the repository; `python assets.py build` packs them into
+# atlas/<name>.atlas + atlas/<name>-<page>.png (needs Pillow). Widgets ask for
+# `source('bg.png')`, which returns the atlas region when the atlas has been built
+# and the plain file otherwise. load_async() decodes every atlas page once at
+# startup in a thread and puts it in Kivy's image cache.
+
+import json
+import os
+import sys
+from threading import Thread
+
+ATLAS_DIR = 'atlas'
+# Raspberry Pi GPUs handle textures up to 2048 x 2048
+ATLAS_SIZE = (2048, 1024)
+
+ATLASES = {
+    'dashboard': [
+        'bg.png',
+        'bottomBar.png',
+        'gauge512.png',
+        'arrow512.png',
+        'coolantScaleFull.png',
+        'fuelScaleFull.png',
+    ],
+    'car': [
+        'car362/car.png',
+        'car362/carClosed.png',
+        'car362/driverClosedDoor.png',
+        'car362/driverOpenedDoor.png',
+        'car362/leftClosedDoor.png',
+        'car362/leftOpenedDoor.png',
+        'car362/passangerClosedDoor.png',
+        'car362/passangerOpenedDoor.png',
+        'car362/rightClosedDoor.png',
+        'car362/rightOpenedDoor.png',
+    ],
+}
+
+
+def _atlas_path(name):
+    return os.path.join(ATLAS_DIR, name)
+
+
+def _regions():
+    # source file -> atlas:// uri, only for atlases that have been built
+    regions = {}
+    for name, filenames in ATLASES.items():
+        if not os.path.exists(_atlas_path(name) + '.atlas'):
+            continue
+        for filename in filenames:
+            region = os.path.splitext(os.path.basename(filename))[0]
+            regions[filename] = 'atlas://%s/%s' % (_atlas_path(name), region)
+    return regions
+
+
+_sources = _regions()
+
+
+def source(filename):
+    return _sources.get(filename, filename)
+
+
+def _files():
+    # the image files behind source(): atlas pages, or the loose images of an atlas not built
+    files = []
+    for name, filenames in sorted(ATLASES.items()):
+        path = _atlas_path(name) + '.atlas'
+        if os.path.exists(path):
+            with open(path) as atlas_file:
+                files.extend(os.path.join(ATLAS_DIR, page) for page in sorted(json.load(atlas_file)))
+        else:
+            files.extend(filenames)
+    return files
+
+
+def load_async(callback):
+    # Decodes every image in a thread and puts them in Kivy's image cache, where the
+    # widgets and atlases find them by path: only the texture upload is left to the
+    # main thread. callback() is called on the main thread once everything is loaded.
+    from kivy.cache import Cache
+    from kivy.clock import Clock
+    from kivy.core.image import ImageLoader
+    from kivy.resources import resource_find
+
+    def loaded(images):
+        for path, image in images:
+            Cache.append('kv.image', '%s|0|0' % path, image)
+        callback()
+
+    def load():
+        images = []
+        for filename in _files():
+            path = resource_find(filename)
+            images.append((path, ImageLoader.load(path)))
+        Clock.schedule_once(lambda dt: loaded(images))
+
+    thread = Thread(target=load)
+    thread.daemon = True
+    thread.start()
+
+
+def build():
+    from kivy.atlas import Atlas
+
+    if not os.path.isdir(ATLAS_DIR):
+        os.makedirs(ATLAS_DIR)
+    for name, filenames in sorted(ATLASES.items()):
+        Atlas.create(_atlas_path(name), filenames, ATLAS_SIZE)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ['build']:
+        print('usage: python assets.py build')
+        sys.exit(1)
+    build()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+# Optional asyncio CAN engine, runs on the same event loop as the Kivy app
+# (App.async_run, Kivy >= 2.0) instead of the RequestsLoop and Notifier threads.
+# Each request is a coroutine that sends the poll group and awaits the matching
+# response, so there is exactly one request in flight and no cross-thread handoff.
+
+import asyncio
+
+import can
+
+from decoders import RESPONSE_PENDING
+
+
+class QueueListener(object):
+    # Hands the received frames to the event loop. Replaces can.AsyncBufferedReader,
+    # which in python-can 3.1.1 builds its queue with the `loop` argument that
+    # asyncio.Queue no longer takes on Python >= 3.10.
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def on_message_received(self, message):
+        # Notifier thread or event loop, whichever reads the bus
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, message)
+
+    __call__ = on_message_received
+
+
+class AsyncCanEngine(object):
+    def __init__(self, bus, scheduler, channels, monitor=None):
+        self.bus = bus
+        self.scheduler = scheduler
+        self.channels = channels
+        self.monitor = monitor
+        self._pending = None
+        self._answer = None
+
+    def response_received(self, name):
+        # called by CanListener for every decoded signal
+        if self._pending is not None and self.scheduler.group_of(name) is self._pending:
+            if not self._answer.done():
+                self._answer.set_result(True)
+
+    def negative_response(self, response_id, service, code):
+        # called by CanListener for a 0x7F response, see PollScheduler.negative_response
+        group = self._pending
+        if code == RESPONSE_PENDING or group is None or group.response_id != response_id:
+            return
+        if len(group.signals) > 1:
+            self.scheduler.split(group)
+        if not self._answer.done():
+            self._answer.set_result(False)
+
+    async def request(self, group):
+        # send one poll group and wait for its answer, returns False on timeout
+        loop = asyncio.get_event_loop()
+        self._answer = loop.create_future()
+        self._pending = group
+        if self.monitor is not None:
+            self.monitor.request_sent(group)
+        channel = self.channels[group.response_id]
+        try:
+            if len(group.request) <= 7:
+                channel.send(group.request)
+            else:
+                # multi frame requests block on the ECU's flow control, keep them off the loop
+                if not await loop.run_in_executor(None, channel.send, group.request):
+                    self.scheduler.split(group)
+                    return False
+            return await asyncio.wait_for(self._answer, self.scheduler.timeout)
+        except asyncio.TimeoutError:
+            return False
+        except can.CanError:
+            return False
+        finally:
+            self._pending = None
+
+    async def _receive(self, queue, listener):
+        while True:
+            listener.on_message_received(await queue.get())
+
+    async def run(self, listener, extra_listeners=()):
+        # `listener` is a CanListener that reports its responses back to this engine,
+        # `extra_listeners` (e.g. a FrameJournal) are attached to the Notifier as they are
+        loop = asyncio.get_event_loop()
+        reader = QueueListener(loop)
+        notifier = can.Notifier(self.bus, [reader] + list(extra_listeners), loop=loop)
+        receiving = asyncio.ensure_future(self._receive(reader.queue, listener))
+        try:
+            while True:
+                group, delay = self.scheduler.pop_due()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self.request(group)
+        finally:
+            receiving.cancel()
+            notifier.stop()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+# Offline decoding of recorded CAN traffic with NumPy (needed only by this module).
+#
+# decode_frames() takes a structured array with at least the fields
+#   timestamp       f8
+#   arbitration_id  u4
+#   data            u1 x 8
+# (load_journal() returns the frames of a FrameJournal file in that form) and
+# returns {signal name: (timestamps, values)} for every signal of the registry.
+# The DID matching and scaling are the registry's, as in CanListener, but every
+# sample is returned: there is no deadband or rate limit.
+#
+# Single frame responses are decoded column-wise, one pass per DID position in
+# the response. Multi frame (ISO-TP) responses are rare, only for batched slow
+# signals, and go through IsoTpChannel and decode_payload one frame at a time.
+#
+#   python batchdecode.py drive.journal     per signal summary and decode rate
+
+import sys
+import time
+
+import numpy as np
+
+from decoders import registry as default_registry, ecus, READ_DATA_BY_IDENTIFIER, POSITIVE_RESPONSE
+from isotp import IsoTpChannel, SINGLE_FRAME, FIRST_FRAME, CONSECUTIVE_FRAME
+from journal import MAGIC, HEADER, RECORD, FLAG_SENT
+
+# journal.RECORD as a NumPy dtype
+JOURNAL_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('arbitration_id', '<u4'),
+    ('dlc', 'u1'),
+    ('flags', 'u1'),
+    ('pad', 'V2'),
+    ('data', 'u1', (8,)),
+])
+assert JOURNAL_DTYPE.itemsize == RECORD.size
+
+
+def load_journal(path):
+    # memory-mapped frames of a FrameJournal file
+    with open(path, 'rb') as journal_file:
+        magic, version, record_size = HEADER.unpack(journal_file.read(HEADER.size))
+    if magic != MAGIC or record_size != RECORD.size:
+        raise ValueError('%s is not a frame journal' % path)
+    return np.memmap(path, dtype=JOURNAL_DTYPE, mode='r', offset=HEADER.size)
+
+
+# vectorized Layout.unpack, keyed by layout name: (flat data, value offsets) -> raw values
+UNPACK = {
+    'u8': lambda flat, offsets: flat[offsets],
+    'u16': lambda flat, offsets: flat[offsets].astype(np.uint16) << 8 | flat[offsets + 1],
+    'hour_minute': lambda flat, offsets: np.stack([flat[offsets], flat[offsets + 1]], axis=1),
+}
+
+
+def scale(signal, raw):
+    # Signal.decode on an array of raw values
+    if signal.factor == 1 and signal.divisor == 1:
+        return raw.astype(np.int64) + signal.offset if signal.offset else raw
+    return (raw.astype(np.float64) + signal.offset) * signal.factor / signal.divisor
+
+
+def _single_frames(timestamps, ids, data, registry, samples):
+    # SF responses: [0x0L, 0x62, DID, value, DID, value, ...]
+    signals = list(registry)
+    response_ids = registry.response_ids()
+    # response id index << 16 | DID -> index in `signals`, -1 for unknown DIDs
+    table = np.full(len(response_ids) << 16, -1, dtype=np.int16)
+    for index, signal in enumerate(signals):
+        table[response_ids.index(signal.response_id) << 16 | signal.command] = index
+    sizes = np.array([signal.layout.size for signal in signals])
+
+    response = (data[:, 0] >> 4 == SINGLE_FRAME) & (data[:, 1] == READ_DATA_BY_IDENTIFIER | POSITIVE_RESPONSE)
+    rows = np.nonzero(response)[0].astype(np.int32)
+    ecu = np.searchsorted(response_ids, ids[rows]).astype(np.int32) << 16
+    flat = data.reshape(-1)
+    # flat offsets of the next DID and of the end of the payload
+    pos = rows * 8 + 2
+    end = pos - 1 + (flat[pos - 2] & 0x0F)
+
+    # each pass reads the next DID of the frames still in `rows`
+    while len(rows):
+        keep = pos + 2 < end
+        if not keep.all():
+            rows, ecu, pos, end = rows[keep], ecu[keep], pos[keep], end[keep]
+        index = table[ecu | flat[pos].astype(np.int32) << 8 | flat[pos + 1]]
+        # like decode_payload, a frame stops at its first unknown DID
+        found = index >= 0
+        found[found] &= pos[found] + 2 + sizes[index[found]] <= end[found]
+        index = np.where(found, index, len(signals))
+
+        # frames grouped by signal, in frame order within a signal
+        order = np.argsort(index, kind='stable')
+        counts = np.bincount(index, minlength=len(signals) + 1)
+        ends = np.cumsum(counts)
+        for signal_index, signal in enumerate(signals):
+            if not counts[signal_index]:
+                continue
+            hits = order[ends[signal_index] - counts[signal_index]:ends[signal_index]]
+            raw = UNPACK[signal.layout.name](flat, pos[hits] + 2)
+            samples.setdefault(signal.name, []).append((timestamps[rows[hits]], scale(signal, raw)))
+
+        pos = pos + 2 + np.where(found, sizes[np.minimum(index, len(signals) - 1)], 0)
+        if not found.all():
+            rows, ecu, pos, end = rows[found], ecu[found], pos[found], end[found]
+
+
+def _multi_frames(timestamps, ids, data, registry, samples):
+    # FF/CF responses, reassembled per ECU in frame order
+    frame_type = data[:, 0] >> 4
+    rows = np.nonzero((frame_type == FIRST_FRAME) | (frame_type == CONSECUTIVE_FRAME))[0]
+    if not len(rows):
+        return
+    channels = dict((response_id, IsoTpChannel(lambda arbitration_id, data: None, request_id, response_id))
+                    for request_id, response_id in ecus.items())
+    decoded = {}
+    for row in rows:
+        response_id = int(ids[row])
+        channel = channels.get(response_id)
+        if channel is None:
+            continue
+        payload = channel.on_frame(bytearray(data[row]))
+        if payload is None:
+            continue
+        for signal, value in registry.decode_payload(response_id, payload, 0, len(payload)):
+            decoded.setdefault(signal, []).append((timestamps[row], value))
+    for signal, values in decoded.items():
+        samples.setdefault(signal.name, []).append((np.array([timestamp for timestamp, value in values]),
+                                                    np.array([value for timestamp, value in values])))
+
+
+def decode_frames(frames, registry=default_registry):
+    # {signal name: (timestamps, values)}, both sorted by time; hour_minute values are (n, 2)
+    responses = np.isin(frames['arbitration_id'], registry.response_ids())
+    if 'flags' in frames.dtype.names:
+        responses &= frames['flags'] & FLAG_SENT == 0
+    if not responses.all():
+        frames = frames[responses]
+    timestamps = frames['timestamp']
+    ids = frames['arbitration_id']
+    data = np.ascontiguousarray(frames['data'], dtype=np.uint8)
+
+    samples = {}
+    _single_frames(timestamps, ids, data, registry, samples)
+    _multi_frames(timestamps, ids, data, registry, samples)
+
+    series = {}
+    for name, parts in samples.items():
+        signal_timestamps = np.concatenate([part[0] for part in parts])
+        values = np.concatenate([part[1] for part in parts])
+        if len(parts) > 1:
+            order = np.argsort(signal_timestamps, kind='stable')
+            signal_timestamps, values = signal_timestamps[order], values[order]
+        series[name] = (signal_timestamps, values)
+    return series
+
+
+def main():
+    if len(sys.argv) != 2:
+        print('usage: python batchdecode.py <journal>')
+        sys.exit(1)
+    frames = load_journal(sys.argv[1])
+    start = time.monotonic()
+    series = decode_frames(frames)
+    elapsed = time.monotonic() - start
+    print('%d frames in %.3f s, %.0f frames/s' % (len(frames), elapsed, len(frames) / elapsed if elapsed else 0))
+    for name in sorted(series):
+        timestamps, values = series[name]
+        if values.ndim > 1:
+            print('%-24s %8d samples' % (name, len(values)))
+        else:
+            print('%-24s %8d samples  min %10.2f  max %10.2f  mean %10.2f' % (name, len(values), values.min(),
+                                                                             values.max(), values.mean()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+# Headless micro-benchmarks of the decode, signal update and widget update paths.
+#
+#   python benchmark.py                        run and compare with the stored baseline
+#   python benchmark.py --save                 store this run as the new baseline
+#   python benchmark.py --module blackCockpit  benchmark the other dashboard
+#
+# Kivy runs with the mock GL backend and no window, so "frame" numbers are the
+# CPU side of a frame (property updates, layout, label rasterization), not GPU time.
+# A result more than --tolerance slower than the baseline fails the run.
+# idle_cpu_* are the CPU share (%) of the main loop while no signal changes,
+# at full frame rate and once the frame governor has dropped to its idle rate.
+
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+
+os.environ.setdefault('KIVY_GL_BACKEND', 'mock')
+os.environ.setdefault('KIVY_WINDOW', 'sdl2')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+os.environ['KIVY_NO_ARGS'] = '1'
+os.environ.setdefault('CAR_INTERFACE', 'virtual')
+os.environ.setdefault('CAR_CHANNEL', 'benchmark')
+
+import can
+
+from decoders import registry, READ_DATA_BY_IDENTIFIER, POSITIVE_RESPONSE
+from simulator import DEFAULT_VALUES
+from signalstore import SignalStore
+
+BASELINE_FILE = 'benchmark_baseline.json'
+
+
+def measure(function, number):
+    # best of five runs, microseconds per call
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6
+
+
+def signal_values(signal, count):
+    # `count` distinct values around the simulator's default, so no update is deduplicated
+    if signal.name == 'time':
+        return [(i // 60 % 24, i % 60) for i in range(count)]
+    default = DEFAULT_VALUES[signal.name]
+    step = signal.factor / float(signal.divisor)
+    return [signal.decode(signal.encode(default + i % 32 * step), 0) for i in range(count)]
+
+
+def response_frames(count):
+    # single frame responses of every signal, as CanListener receives them
+    frames = []
+    values = dict((signal.name, signal_values(signal, count)) for signal in registry)
+    for i in range(count):
+        for signal in registry:
+            value = values[signal.name][i]
+            payload = [READ_DATA_BY_IDENTIFIER | POSITIVE_RESPONSE, signal.command >> 8, signal.command & 0xff]
+            payload += signal.encode(value)
+            data = [len(payload)] + payload
+            frames.append(can.Message(arbitration_id=signal.response_id, data=data + [0x55] * (8 - len(data)),
+                                      is_extended_id=False))
+    return frames
+
+
+def loop_cpu(seconds):
+    # CPU time of the Kivy main loop per wall clock time, in percent
+    from kivy.base import EventLoop
+
+    start = time.monotonic()
+    cpu = time.process_time()
+    while time.monotonic() - start < seconds:
+        EventLoop.idle()
+    return (time.process_time() - cpu) / (time.monotonic() - start) * 100
+
+
+def run_benchmarks(dashboard_module):
+    from kivy.clock import Clock
+
+    results = {}
+    store = SignalStore()
+    dashboard = dashboard_module.Dashboard(store)
+    listener = dashboard_module.CanListener(store, dashboard_module.scheduler)
+
+    # decode: frames through CanListener.on_message_received
+    frames = response_frames(64)
+
+    def decode():
+        for frame in frames:
+            listener.on_message_received(frame)
+    results['decode_frame'] = measure(decode, 20) / len(frames)
+
+    results['store_set'] = measure(lambda: store.set('rpm', 1000), 100000)
+
+    # one signal update applied to the widgets, including label rasterization
+    for signal in registry:
+        if signal.name not in dashboard.signal_handlers:
+            continue
+        values = signal_values(signal, 16)
+        state = {'index': 0}
+
+        def update(signal=signal, values=values, state=state):
+            state['index'] = (state['index'] + 1) % len(values)
+            dashboard.update_signal(signal.name, values[state['index']])
+            Clock.tick_draw()
+        results['update_' + signal.name] = measure(update, 200)
+
+    # a frame in which every signal changed
+    all_values = dict((signal.name, signal_values(signal, 16)) for signal in registry)
+    frame_state = {'index': 0}
+
+    def frame():
+        frame_state['index'] = (frame_state['index'] + 1) % 16
+        for name, values in all_values.items():
+            store.set(name, values[frame_state['index']])
+        dashboard.apply_signals(0)
+        Clock.tick_draw()
+    results['frame_all_signals'] = measure(frame, 100)
+
+    # main loop with nothing changing, before and after the governor goes idle,
+    # once the car animations started by update_doors have finished
+    loop_cpu(1)
+    governor = dashboard_module.governor
+    if governor is not None:
+        governor.boost()
+        results['idle_cpu_full_rate'] = loop_cpu(governor.hold / 2.0)
+        while not governor.idle:
+            loop_cpu(0.1)
+        results['idle_cpu'] = loop_cpu(2)
+    else:
+        results['idle_cpu_full_rate'] = loop_cpu(1)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dashboard micro-benchmarks')
+    parser.add_argument('--module', default='main', help='dashboard module, main or blackCockpit')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, 0.25 = 25%%')
+    args = parser.parse_args()
+
+    dashboard_module = __import__(args.module)
+    results = run_benchmarks(dashboard_module)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baselines = json.load(baseline_file)
+    baseline = baselines.get(args.module, {})
+
+    regressions = []
+    print('%-32s %12s %12s %12s' % ('benchmark', 'us/op', 'ops/s', 'baseline'))
+    for name in sorted(results):
+        us = results[name]
+        reference = baseline.get(name)
+        mark = ''
+        if reference is not None and us > reference * (1 + args.tolerance):
+            regressions.append(name)
+            mark = '  REGRESSION'
+        rate = '-' if name.startswith('idle_cpu') else '%.0f' % (1e6 / us if us else 0)
+        print('%-32s %12.2f %12s %12s%s' % (name, us, rate,
+                                             '%.2f' % reference if reference is not None else '-', mark))
+
+    if args.save:
+        baselines[args.module] = results
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        print('baseline saved to %s' % args.baseline)
+    elif regressions:
+        print('%d regression(s): %s' % (len(regressions), ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
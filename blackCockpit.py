@@ -1,447 +1,396 @@
 # -*- coding: utf-8 -*-
 
-import can
+import time
+started = time.monotonic()
+
+import asyncio
 import os
 import sys
-from threading import Thread
-import time
+import traceback
 import datetime
 
+# must be set before the first Kivy import, an environment value wins
+os.environ.setdefault('KIVY_GL_BACKEND', 'gl')
+os.environ.setdefault('KIVY_WINDOW', 'egl_rpi')
+
+from decoders import registry
+from signalstore import SignalStore
+from instrumentation import LatencyMonitor, StartupTimer
+from governor import FrameGovernor
+from snapshot import StateSnapshot, read_snapshot
+import acquisition
+from acquisition import CanListener, AcquisitionProcess, RingStore, scheduler, channels
+from widgets import Gauge, Car, BarGauge, GlyphLabel
+import assets
 
 from kivy.app import App
-from kivy.properties import NumericProperty
-from kivy.properties import BoundedNumericProperty
-from kivy.properties import StringProperty
+from kivy.clock import Clock
+from kivy.config import Config
 from kivy.uix.label import Label
 from kivy.uix.image import Image
 from kivy.uix.floatlayout import FloatLayout
-from kivy.uix.scatter import Scatter
-from kivy.uix.stencilview import StencilView
 from kivy.animation import Animation
 
+# CAR_ASYNCIO=1 runs requests and responses on the Kivy event loop (Kivy >= 2.0)
+use_asyncio = os.environ.get('CAR_ASYNCIO') == '1'
+if use_asyncio and not hasattr(App, 'async_run'):
+    print('CAR_ASYNCIO=1 needs Kivy >= 2.0 (App.async_run), running the CAN threads instead')
+    use_asyncio = False
 
-os.environ['KIVY_GL_BACKEND'] = 'gl'
-os.environ['KIVY_WINDOW'] = 'egl_rpi'
-
-
-message_commands = {
-    'GET_RPM': 0xF40C,
-    'GET_SPEED': 0xF40D,
-    'GET_DOORS_COMMAND': 0x220D,
-    'GET_OIL_TEMPERATURE': 0x202F,
-    'GET_OUTDOOR_TEMPERATURE': 0x1014,
-    'GET_INDOOR_TEMPERATURE': 0x2613,
-    'GET_COOLANT_TEMPERATURE': 0xF405,
-    'GET_KM_LEFT': 0x2294,
-    'GET_FUEL_LEFT': 0x229A,
-    'GET_TIME': 0x2216,
-    'GET_DISTANCE': 0x2203,
-    'GET_FUEL_CONSUMPTION': 0x2299
-}
-
-bus = can.interface.Bus(channel='can0', bustype='socketcan')
-
-
-class PropertyState(object):
-    def __init__(self, last, current):
-        self.last = last
-        self.current = current
-
-    def last_is_not_now(self):
-        return self.last is not self.current
-
-
-class CanListener(can.Listener):
-    def __init__(self, dashboard):
-        self.dashboard = dashboard
-        self.speed_states = PropertyState(None, None)
-        self.rpm_states = PropertyState(None, None)
-        self.km_left_states = PropertyState(None, None)
-        self.coolant_temperature_states = PropertyState(None, None)
-        self.fuel_left_states = PropertyState(None, None)
-        self.oil_temperature_states = PropertyState(None, None)
-        self.time_states = PropertyState(None, None)
-        self.outdoor_temperature_states = PropertyState(None, None)
-        self.distance_states = PropertyState(None, None)
-        self.fuel_consumption_states = PropertyState(None, None)
-        self.doors_states = PropertyState(None, None)
-        self.car_minimized = True
+# CAR_MULTIPROCESS=1 runs the CAN acquisition in a supervised child process, see acquisition.py
+multiprocess = os.environ.get('CAR_MULTIPROCESS') == '1'
+
+# CAR_STATS=<file> dumps per signal latency histograms every 10 s, CAR_STATS_OVERLAY=1 shows them on screen
+stats_file = os.environ.get('CAR_STATS')
+stats_overlay = os.environ.get('CAR_STATS_OVERLAY') == '1'
+monitor = LatencyMonitor() if stats_file or stats_overlay else None
+
+# CAR_FIRST_FRAME_DEADLINE=<seconds> from process start to the first frame, reported when missed
+first_frame_deadline = float(os.environ.get('CAR_FIRST_FRAME_DEADLINE', '2'))
+startup = StartupTimer(started)
+
+# CAR_SNAPSHOT=<file> keeps the last known values for the next start ('' = off), saved every CAR_SNAPSHOT_INTERVAL s
+snapshot_file = os.environ.get('CAR_SNAPSHOT', '/var/tmp/car_last_state.bin')
+snapshot_interval = float(os.environ.get('CAR_SNAPSHOT_INTERVAL', '5'))
+
+# CAR_IDLE_FPS=<fps> frame rate once nothing has moved for CAR_IDLE_HOLD s (default 5 fps after 2 s, 0 = off)
+idle_fps = float(os.environ.get('CAR_IDLE_FPS', '5'))
+governor = FrameGovernor(Clock, Config.getint('graphics', 'maxfps'), idle_fps,
+                         float(os.environ.get('CAR_IDLE_HOLD', '2'))) if idle_fps else None
+
+# CAR_NEEDLE_FILTER=critically_damped|linear|none, how the RPM needle moves between samples
+needle_filter = os.environ.get('CAR_NEEDLE_FILTER', 'critically_damped')
 
-    def on_message_received(self, message):
-        message_command = message.data[3] | message.data[2] << 8
-
-        if message.arbitration_id == 0x77E and message_command == message_commands['GET_RPM']:
-            self.rpm_states.current = message.data[5] | message.data[4] << 8
-            if self.rpm_states.last_is_not_now():
-                self.dashboard.rpm.value = self.rpm_states.current / 4
-                self.rpm_states.last = self.rpm_states.current
-
-        if message.arbitration_id == 0x77E and message_command == message_commands['GET_SPEED']:
-            self.speed_states.current = message.data[4]
-            if self.speed_states.last_is_not_now():
-                self.dashboard.speedometer.text = str(self.speed_states.current)
-                self.speed_states.last = self.speed_states.current
-
-        if message.arbitration_id == 0x77E and message_command == message_commands['GET_KM_LEFT']:
-            self.km_left_states.current = message.data[5] | message.data[4] << 8
-            if self.km_left_states.last_is_not_now():
-                self.dashboard.km_left_label.text = str(self.km_left_states.current)
-                self.km_left_states.last = self.km_left_states.current
-
-        if message.arbitration_id == 0x77E and message_command == message_commands['GET_COOLANT_TEMPERATURE']:
-            self.coolant_temperature_states.current = message.data[4]
-            if self.coolant_temperature_states.last_is_not_now():
-                temperature = (self.coolant_temperature_states.current - 63)/2*1.5
-                if temperature > 50:
-                    self.dashboard.coolant_bar.height = (temperature-50)*3.2
-                    self.coolant_temperature_states.last = self.coolant_temperature_states.current
-
-        if message.arbitration_id == 0x77E and message_command == message_commands['GET_FUEL_LEFT']:
-            self.fuel_left_states.current = message.data[5] | message.data[4] << 8
-            if self.fuel_left_states.last_is_not_now():
-                # 55L = 256
-                # 0L = 0
-                # 1L = 4.65 
-                self.dashboard.fuel_bar.height = self.fuel_left_states.current/8 * 4.65
-                self.fuel_left_states.last = self.fuel_left_states.current
-
-        if message.arbitration_id == 0x77E and message_command == message_commands['GET_OIL_TEMPERATURE']:
-            self.oil_temperature_states.current = message.data[4]
-            if self.oil_temperature_states.last_is_not_now():
-                self.dashboard.oil_label.text = str(self.oil_temperature_states.current - 58)
-                self.oil_temperature_states.last = self.oil_temperature_states.current
-
-        if message.arbitration_id == 0x77E and message_command == message_commands['GET_TIME']:
-            self.time_states.current = message.data[5] | message.data[4] << 8
-            if self.time_states.last_is_not_now():
-                self.dashboard.clock.text = str(message.data[4]) + ":" + str(message.data[5])
-                self.time_states.last = self.time_states.current
-
-        if message.arbitration_id == 0x77E and message_command == message_commands['GET_OUTDOOR_TEMPERATURE']:
-            self.outdoor_temperature_states.current = float(message.data[4])
-            if self.outdoor_temperature_states.last_is_not_now():
-                self.dashboard.outdoor_temperature_label.text = str((self.outdoor_temperature_states.current - 100) / 2)
-                self.outdoor_temperature_states.last = self.outdoor_temperature_states.current
-
-        if message.arbitration_id == 0x77E and message_command == message_commands['GET_DISTANCE']:
-            self.distance_states.current = message.data[5] | message.data[4] << 8
-            if self.distance_states.last_is_not_now():
-                self.dashboard.distance_label.text = str(self.distance_states.current * 10)
-                self.distance_states.last = self.distance_states.current
-
-        if message.arbitration_id == 0x77E and message_command == message_commands['GET_FUEL_CONSUMPTION']:
-            self.fuel_consumption_states.current = message.data[5] | message.data[4] << 8
-            if self.fuel_consumption_states.last_is_not_now():
-                self.dashboard.fuel_consumption_label.text = str(self.fuel_consumption_states.current / 10)
-                self.fuel_consumption_states.last = self.fuel_consumption_states.current
-
-        if message.arbitration_id == 0x77E and message_command == message_commands['GET_DOORS_COMMAND']:
-            self.doors_states.current = message.data[4]
-            if self.doors_states.last_is_not_now():
-                self.doors_states.last = self.doors_states.current
-                self.dashboard.car.doors_states = message.data[4]
-
-                # all doors closed -> minimize car
-                if self.doors_states.current == 0x55:
-                    self.dashboard.minimize_car()
-                    self.car_minimized = True
-                else:
-                    if self.car_minimized:
-                        self.dashboard.maximize_car()
-                        self.car_minimized = False
+# the bus is opened by start_can() once the dashboard is on screen, `history` is its CAR_HISTORY writer
+history = None
 
 
 class Dashboard(FloatLayout):
-    def __init__(self, **kwargs):
+    # With `deferred` only the background is created, build_widgets() adds the rest
+    # once the first frame is on screen and the images are loaded. `restored` values
+    # are shown dimmed from the start until the live value of the signal arrives.
+    stale_opacity = 0.5
+    # signals that switch the frame governor back to full rate
+    boost_signals = ('rpm', 'speed', 'doors')
+
+    def __init__(self, store, deferred=False, restored=None, **kwargs):
         super(Dashboard, self).__init__(**kwargs)
-
-        # Background
-        self.background_image = Image(source='bg.png')
+        self.store = store
+        self.restored = restored or {}
+        # signal name -> widget showing a restored value
+        self.stale = {}
+        # the label positions were drawn for text boxes of the size the dashboard has before
+        # it is laid out, build_widgets() may run after that
+        self.text_box = tuple(self.size)
+
+        # Background, from its own file for the first frame: it decodes faster than a whole atlas page
+        self.background_image = Image(source='bg.png' if deferred else assets.source('bg.png'))
         self.add_widget(self.background_image)
 
+        if not deferred:
+            self.build_widgets()
+
+    def build_widgets(self):
+        self.background_image.source = assets.source('bg.png')
+
         # RPM
-        self.rpm = Gauge(file_gauge="gauge512.png", do_rotation=False, do_scale=False, do_translation=False, value=0,
-                         size_gauge=512, pos=(72, -16))
+        self.rpm = Gauge(file_gauge=assets.source("gauge512.png"), do_rotation=False, do_scale=False,
+                         do_translation=False, value=0, smoothing=needle_filter, size_gauge=512, pos=(72, -16))
         self.add_widget(self.rpm)
         self.rpm.value = 1
 
         # Speedometer
-        self.speedometer = Label(text='0', font_size=80, font_name='hemi_head_bd_it.ttf', pos=(274,194))
+        self.speedometer = GlyphLabel(text='0', font_size=80, font_name='hemi_head_bd_it.ttf', pos=(274,194))
         self.rpm.add_widget(self.speedometer)
 
         # BOTTOM BAR
-        self.bottom_bar = Image(source='bottomBar.png', pos=(0, -209))
+        self.bottom_bar = Image(source=assets.source('bottomBar.png'), pos=(0, -209))
         self.add_widget(self.bottom_bar)
 
         # KM LEFT
-        self.km_left_label = Label(text='000', font_name='Avenir.ttc', halign="right", text_size=self.size,
-                                   font_size=32, pos=(260, 234))
+        self.km_left_label = GlyphLabel(text='000', font_name='Avenir.ttc', halign="right", text_size=self.text_box,
+                                        font_size=32, pos=(260, 234))
         self.add_widget(self.km_left_label)
 
         # CLOCK
-        self.clock = Label(text='00:00', font_name='Avenir.ttc', halign="right", text_size=self.size, font_size=32,
-                           pos=(-130, -180))
+        self.clock = GlyphLabel(text='00:00', font_name='Avenir.ttc', halign="right", text_size=self.text_box, font_size=32,
+                                pos=(-130, -180))
         self.add_widget(self.clock)
 
         # OUTDOOR TEMPERATURE
-        self.outdoor_temperature_label = Label(text='00.0', font_name='Avenir.ttc', halign="right", text_size=self.size,
-                                               font_size=32, pos=(95, -180))
+        self.outdoor_temperature_label = GlyphLabel(text='00.0', font_name='Avenir.ttc', halign="right",
+                                                    text_size=self.text_box, font_size=32, pos=(95, -180))
         self.add_widget(self.outdoor_temperature_label)
-        self.unitC = Label(text='°C', font_name='Avenir.ttc', halign="left", text_size=self.size, font_size=24,
+        self.unitC = Label(text='°C', font_name='Avenir.ttc', halign="left", text_size=self.text_box, font_size=24,
                            pos=(200, -172))
         self.add_widget(self.unitC)
 
         # OIL TEMPERATURE
-        self.oil_label = Label(text='00', font_name='Avenir.ttc', halign="right", text_size=self.size, font_size=27,
-                               pos=(-390, -180))
+        self.oil_label = GlyphLabel(text='00', font_name='Avenir.ttc', halign="right", text_size=self.text_box,
+                                    font_size=27, pos=(-390, -180))
         self.add_widget(self.oil_label)
 
         # DISTANCE
-        self.distance_label = Label(text='000000', font_name='Avenir.ttc', halign="right", text_size=self.size,
-                                    font_size=27, pos=(305, -180))
+        self.distance_label = GlyphLabel(text='000000', font_name='Avenir.ttc', halign="right",
+                                         text_size=self.text_box, font_size=27, pos=(305, -180))
         self.add_widget(self.distance_label)
 
         # FUEL CONSUMPTION
-        self.fuel_consumption_label = Label(text='00.0', font_name='Avenir.ttc', halign="right", text_size=self.size,
-                                     font_size=32, pos=(-290, 234))
+        self.fuel_consumption_label = GlyphLabel(text='00.0', font_name='Avenir.ttc', halign="right",
+                                                 text_size=self.text_box, font_size=32, pos=(-290, 234))
         self.add_widget(self.fuel_consumption_label)
 
+        # TRIP COMPUTER
+        self.trip_consumption_label = GlyphLabel(text='-', font_name='Avenir.ttc', halign="right",
+                                                 text_size=self.text_box, font_size=24, pos=(-290, 194))
+        self.add_widget(self.trip_consumption_label)
+        self.range_label = GlyphLabel(text='-', font_name='Avenir.ttc', halign="right", text_size=self.text_box,
+                                      font_size=24, pos=(260, 194))
+        self.add_widget(self.range_label)
+
         # COOLANT TEMPERATURE
-        self.coolant_bar = StencilView(size_hint=(None, None), size=(94, 256), pos=(15, 112))
-        self.coolant_image = Image(source='coolantScaleFull.png', size=(94, 256), pos=(15, 112))
-        self.coolant_bar.add_widget(self.coolant_image)
+        # 3.2 px per degree above 50
+        self.coolant_bar = BarGauge(source=assets.source('coolantScaleFull.png'), min_value=50, max_value=50 + 256 / 3.2,
+                                    size=(94, 256), pos=(15, 112))
         self.add_widget(self.coolant_bar)
-        self.coolant_bar.height = 0
 
         # FUEL LEFT
-        self.fuel_bar = StencilView(size_hint=(None, None), size=(94, 256), pos=(686, 112))
-        self.fuel_image = Image(source='fuelScaleFull.png', size=(94, 256), pos=(686, 112))
-        self.fuel_bar.add_widget(self.fuel_image)
+        # 1L = 4.65 px
+        self.fuel_bar = BarGauge(source=assets.source('fuelScaleFull.png'), min_value=0, max_value=256 / 4.65,
+                                 size=(94, 256), pos=(686, 112))
         self.add_widget(self.fuel_bar)
-        self.fuel_bar.height = 0
 
         # CAR DOORS
         self.car = Car(pos=(257, 84))
         self.add_widget(self.car)
         self.minimize_car()
+        self.car_minimized = True
+
+        self.signal_handlers = {
+            'rpm': self.set_rpm,
+            'speed': self.set_speed,
+            'km_left': self.set_km_left,
+            'coolant_temperature': self.set_coolant_temperature,
+            'fuel_left': self.set_fuel_left,
+            'oil_temperature': self.set_oil_temperature,
+            'time': self.set_time,
+            'outdoor_temperature': self.set_outdoor_temperature,
+            'distance': self.set_distance,
+            'fuel_consumption': self.set_fuel_consumption,
+            'doors': self.set_doors,
+            'trip_consumption': self.set_trip_consumption,
+            'range': self.set_range,
+        }
+        self.signal_widgets = {
+            'km_left': self.km_left_label,
+            'coolant_temperature': self.coolant_bar,
+            'fuel_left': self.fuel_bar,
+            'oil_temperature': self.oil_label,
+            'outdoor_temperature': self.outdoor_temperature_label,
+            'distance': self.distance_label,
+            'fuel_consumption': self.fuel_consumption_label,
+        }
+        self.restore(self.restored)
+
+        # apply the values received from the CAN thread once per frame
+        Clock.schedule_interval(self.apply_signals, 0)
+
+    def restore(self, values):
+        for name, value in values.items():
+            widget = self.signal_widgets.get(name)
+            if widget is not None:
+                self.update_signal(name, value)
+                widget.opacity = self.stale_opacity
+                self.stale[name] = widget
+
+    def apply_signals(self, *args):
+        changed = self.store.take_changed()
+        for name, value in changed.items():
+            self.update_signal(name, value)
+        if self.stale and changed:
+            for name in changed:
+                widget = self.stale.pop(name, None)
+                if widget is not None:
+                    widget.opacity = 1
+        if governor is not None:
+            for name in self.boost_signals:
+                if name in changed:
+                    governor.boost()
+                    break
+            governor.update()
+        if monitor is not None and changed:
+            monitor.signals_applied(changed)
+
+    def update_signal(self, name, value):
+        handler = self.signal_handlers.get(name)
+        if handler is not None:
+            handler(value)
+
+    def set_rpm(self, value):
+        self.rpm.sample(value, self.store.timestamp('rpm'))
+
+    def set_speed(self, value):
+        self.speedometer.text = str(value)
+
+    def set_km_left(self, value):
+        self.km_left_label.text = str(value)
+
+    def set_coolant_temperature(self, value):
+        self.coolant_bar.value = value
+
+    def set_fuel_left(self, value):
+        self.fuel_bar.value = value
+
+    def set_oil_temperature(self, value):
+        self.oil_label.text = str(value)
+
+    def set_time(self, value):
+        self.clock.text = str(value[0]) + ":" + str(value[1])
+
+    def set_outdoor_temperature(self, value):
+        self.outdoor_temperature_label.text = str(value)
+
+    def set_distance(self, value):
+        self.distance_label.text = str(value)
+
+    def set_fuel_consumption(self, value):
+        self.fuel_consumption_label.text = str(value)
+
+    def set_trip_consumption(self, value):
+        self.trip_consumption_label.text = str(value)
+
+    def set_range(self, value):
+        self.range_label.text = str(value)
+
+    def set_doors(self, value):
+        self.car.doors_states = value
+
+        # all doors closed -> minimize car
+        if value == 0x55:
+            self.minimize_car()
+            self.car_minimized = True
+        else:
+            if self.car_minimized:
+                self.maximize_car()
+                self.car_minimized = False
 
     def minimize_car(self):
         anim = Animation(scale=0.5, opacity=0,  t='linear', duration=0.5)
         anim.start(self.car)
+        if governor is not None:
+            governor.track(anim)
 
         anim_rpm = Animation(scale=1, opacity=1, t='linear', duration=0.5)
         anim_rpm.start(self.rpm)
+        if governor is not None:
+            governor.track(anim_rpm)
 
     def maximize_car(self):
         anim = Animation(scale=1, opacity=1,  t='linear', duration=0.5)
         anim.start(self.car)
+        if governor is not None:
+            governor.track(anim)
 
         anim_rpm = Animation(scale=0.5, opacity=0, t='linear', duration=0.5)
         anim_rpm.start(self.rpm)
-
-
-class Car(Scatter):
-    car_image = StringProperty("car362/car.png")
-
-    driver_door_closed_image = StringProperty("car362/driverClosedDoor.png")
-    driver_door_opened_image = StringProperty("car362/driverOpenedDoor.png")
-
-    passenger_door_closed_image = StringProperty("car362/passangerClosedDoor.png")
-    passenger_door_opened_image = StringProperty("car362/passangerOpenedDoor.png")
-
-    left_door_closed_image = StringProperty("car362/leftClosedDoor.png")
-    left_door_opened_image = StringProperty("car362/leftOpenedDoor.png")
-
-    right_door_closed_image = StringProperty("car362/rightClosedDoor.png")
-    right_door_opened_image = StringProperty("car362/rightOpenedDoor.png")
-
-    doors_states = NumericProperty(0)
-
-    size = (286, 362)
-
-    def __init__(self, **kwargs):
-        super(Car, self).__init__(**kwargs)
-
-        _car = Image(source=self.car_image, size=self.size)
-
-        self.driver_door_opened = Image(source=self.driver_door_opened_image, size=self.size)
-        self.passenger_door_opened = Image(source=self.passenger_door_opened_image, size=self.size)
-        self.left_door_opened = Image(source=self.left_door_opened_image, size=self.size)
-        self.right_door_opened = Image(source=self.right_door_opened_image, size=self.size)
-
-        self.driver_door_closed = Image(source=self.driver_door_closed_image, size=self.size)
-        self.passenger_door_closed = Image(source=self.passenger_door_closed_image, size=self.size)
-        self.left_door_closed = Image(source=self.left_door_closed_image, size=self.size)
-        self.right_door_closed = Image(source=self.right_door_closed_image, size=self.size)
-
-        self.add_widget(_car)
-        self.add_widget(self.driver_door_opened)
-        self.add_widget(self.passenger_door_opened)
-        self.add_widget(self.left_door_opened)
-        self.add_widget(self.right_door_opened)
-
-        self.bind(doors_states=self._update)
-
-    def _update(self, *args):
-        driver_door_states = self.doors_states & 1
-        passenger_door_states = self.doors_states & 4
-        left_door_states = self.doors_states & 16
-        right_door_states = self.doors_states & 64
-        if driver_door_states != 0:
-            try:
-                self.remove_widget(self.driver_door_opened)
-                self.add_widget(self.driver_door_closed)
-            except:
-                pass
-        else:
-            try:
-                self.remove_widget(self.driver_door_closed)
-                self.add_widget(self.driver_door_opened)
-            except:
-                pass
-        if passenger_door_states != 0:
-            try:
-                self.remove_widget(self.passenger_door_opened)
-                self.add_widget(self.passenger_door_closed)
-            except:
-                pass
-        else:
-            try:
-                self.remove_widget(self.passenger_door_closed)
-                self.add_widget(self.passenger_door_opened)
-            except:
-                pass
-        if left_door_states != 0:
-            try:
-                self.remove_widget(self.left_door_opened)
-                self.add_widget(self.left_door_closed)
-            except:
-                pass
-        else:
-            try:
-                self.remove_widget(self.left_door_closed)
-                self.add_widget(self.left_door_opened)
-            except:
-                pass
-        if right_door_states != 0:
-            try:
-                self.remove_widget(self.right_door_opened)
-                self.add_widget(self.right_door_closed)
-            except:
-                pass
-        else:
-            try:
-                self.remove_widget(self.right_door_closed)
-                self.add_widget(self.right_door_opened)
-            except:
-                pass
-
-
-class Gauge(Scatter):
-    value = NumericProperty(10)  # BoundedNumericProperty(0, min=0, max=360, errorvalue=0)
-    size_gauge = BoundedNumericProperty(512, min=128, max=512, errorvalue=128)
-    size_text = NumericProperty(10)
-    file_gauge = StringProperty("")
-
-    def __init__(self, **kwargs):
-        super(Gauge, self).__init__(**kwargs)
-
-        self._gauge = Scatter(
-            size=(self.size_gauge, self.size_gauge),
-            do_rotation=False,
-            do_scale=False,
-            do_translation=False
-        )
-
-        _img_gauge = Image(source=self.file_gauge, size=(self.size_gauge, self.size_gauge))
-
-        self._needle = Scatter(
-            size=(self.size_gauge, self.size_gauge),
-            do_rotation=False,
-            do_scale=False,
-            do_translation=False
-        )
-
-        _img_needle = Image(source="arrow512.png", size=(self.size_gauge, self.size_gauge))
-
-        self._gauge.add_widget(_img_gauge)
-        self._needle.add_widget(_img_needle)
-
-        self.add_widget(self._gauge)
-        self.add_widget(self._needle)
-
-        self.bind(pos=self._update)
-        self.bind(size=self._update)
-        self.bind(value=self._turn)
-
-    def _update(self, *args):
-        self._gauge.pos = self.pos
-        self._needle.pos = (self.x, self.y)
-        self._needle.center = self._gauge.center
-
-    def _turn(self, *args):
-        self._needle.center_x = self._gauge.center_x
-        self._needle.center_y = self._gauge.center_y
-        self._needle.rotation = 112-(0.028*self.value)  # 1 rpm = 0.028 gr
-
-
-class RequestsLoop(Thread):
-    def __init__(self):
-        Thread.__init__(self)
-        self.daemon = True
-        self.start()
-
-    canCommands = [
-        can.Message(arbitration_id=0x714,data=[0x03,0x22,message_commands['GET_RPM'] >> 8,message_commands['GET_RPM'] & 0xff, 0x55, 0x55, 0x55, 0x55],extended_id=False),
-        can.Message(arbitration_id=0x714,data=[0x03,0x22,message_commands['GET_SPEED'] >> 8,message_commands['GET_SPEED'] & 0xff, 0x55, 0x55, 0x55, 0x55],extended_id=False),
-        can.Message(arbitration_id=0x714,data=[0x03,0x22,message_commands['GET_DOORS_COMMAND'] >> 8,message_commands['GET_DOORS_COMMAND'] & 0xff, 0x55, 0x55, 0x55, 0x55],extended_id=False),
-        can.Message(arbitration_id=0x714,data=[0x03,0x22,message_commands['GET_KM_LEFT'] >> 8,message_commands['GET_KM_LEFT'] & 0xff, 0x55, 0x55, 0x55, 0x55],extended_id=False),
-        can.Message(arbitration_id=0x714,data=[0x03,0x22,message_commands['GET_OIL_TEMPERATURE'] >> 8,message_commands['GET_OIL_TEMPERATURE'] & 0xff, 0x55, 0x55, 0x55, 0x55],extended_id=False),
-        can.Message(arbitration_id=0x714,data=[0x03,0x22,message_commands['GET_FUEL_LEFT'] >> 8,message_commands['GET_FUEL_LEFT'] & 0xff, 0x55, 0x55, 0x55, 0x55],extended_id=False),
-        can.Message(arbitration_id=0x714,data=[0x03,0x22,message_commands['GET_OUTDOOR_TEMPERATURE'] >> 8,message_commands['GET_OUTDOOR_TEMPERATURE'] & 0xff, 0x55, 0x55, 0x55, 0x55],extended_id=False),
-        can.Message(arbitration_id=0x746,data=[0x03,0x22,message_commands['GET_INDOOR_TEMPERATURE'] >> 8,message_commands['GET_INDOOR_TEMPERATURE'] & 0xff, 0x55, 0x55, 0x55, 0x55],extended_id=False),
-        can.Message(arbitration_id=0x714,data=[0x03,0x22,message_commands['GET_COOLANT_TEMPERATURE'] >> 8,message_commands['GET_COOLANT_TEMPERATURE'] & 0xff, 0x55, 0x55, 0x55, 0x55],extended_id=False),
-        can.Message(arbitration_id=0x714,data=[0x03,0x22,message_commands['GET_TIME'] >> 8,message_commands['GET_TIME'] & 0xff, 0x55, 0x55, 0x55, 0x55],extended_id=False),
-        can.Message(arbitration_id=0x714,data=[0x03,0x22,message_commands['GET_DISTANCE'] >> 8,message_commands['GET_DISTANCE'] & 0xff, 0x55, 0x55, 0x55, 0x55],extended_id=False),
-        can.Message(arbitration_id=0x714,data=[0x03,0x22,message_commands['GET_FUEL_CONSUMPTION'] >> 8,message_commands['GET_FUEL_CONSUMPTION'] & 0xff, 0x55, 0x55, 0x55, 0x55],extended_id=False)
-     ]
-
-    def run(self):
-        # poll RPM every 0.01 sec and poll other sensors for every 10 rpm requests (0.1 sec)
-        message_number = 0
-        rpm_pool_counter = 0
-        while True:
-            if (rpm_pool_counter >= 10):
-                if (message_number == len(self.canCommands)):
-                    message_number = 0
-                try:
-                    bus.send(self.canCommands[message_number])
-                except:
-                    pass
-                message_number = message_number + 1
-                rpm_pool_counter = 0
-
-            else:
-                try:
-                    bus.send(self.canCommands[0])
-                except:
-                    pass
-                rpm_pool_counter = rpm_pool_counter + 1
-            time.sleep(0.01)
+        if governor is not None:
+            governor.track(anim_rpm)
 
 
 class BoxApp(App):
+    # Startup: window and background first, then the images are decoded in a thread
+    # and the widgets, the CAN bus and the requests start once they are loaded.
     def build(self):
-        dashboard = Dashboard()
-        listener = CanListener(dashboard)
-        can.Notifier(bus, [listener])
+        from kivy.base import EventLoop
+        EventLoop.ensure_window()
+        startup.mark('window')
 
-        return dashboard
+        if multiprocess:
+            self.acquisition = AcquisitionProcess()
+            self.store = RingStore(self.acquisition.path)
+        else:
+            self.store = SignalStore()
+        restored = read_snapshot(snapshot_file, registry) if snapshot_file else {}
+        self.dashboard = Dashboard(self.store, deferred=True, restored=restored)
+        startup.mark('background')
+
+        EventLoop.window.bind(on_flip=self.first_frame)
+        return self.dashboard
+
+    def first_frame(self, window):
+        window.unbind(on_flip=self.first_frame)
+        startup.mark('first_frame')
+        if startup.elapsed() > first_frame_deadline:
+            print('first frame after %.2f s, deadline %.2f s' % (startup.elapsed(), first_frame_deadline))
+        assets.load_async(self.assets_loaded)
+
+    def assets_loaded(self):
+        startup.mark('assets')
+        self.dashboard.build_widgets()
+        startup.mark('widgets')
+        self.start_can()
+        startup.mark('can')
+        if snapshot_file:
+            snapshot = StateSnapshot(snapshot_file, registry)
+            Clock.schedule_interval(lambda *args: snapshot.save(self.store.values()), snapshot_interval)
+        if monitor is not None:
+            self.start_instrumentation(self.dashboard)
+        print(startup.report())
+
+    def start_can(self):
+        global history
+        if multiprocess:
+            # the child opens the bus, python-can is not imported here
+            self.acquisition.start()
+            Clock.schedule_interval(self.acquisition.check, 1)
+        elif use_asyncio:
+            from asyncengine import AsyncCanEngine
+            history, ring = acquisition.open_recorders()
+            acquisition.open_bus()
+            journal = acquisition.journal
+            engine = AsyncCanEngine(acquisition.bus, scheduler, channels, monitor)
+            listener = CanListener(self.store, engine, monitor, history, ring)
+            self.engine_task = asyncio.ensure_future(engine.run(listener, [] if journal is None else [journal]))
+            self.engine_task.add_done_callback(self.engine_stopped)
+        else:
+            history = acquisition.start(self.store, monitor)
+
+    def engine_stopped(self, task):
+        # the engine only ends by failing, nothing on screen would be updated again
+        if task.cancelled() or task.exception() is None:
+            return
+        error = task.exception()
+        print('CAN engine failed, stopping')
+        traceback.print_exception(type(error), error, error.__traceback__)
+        self.stop()
+
+    def on_stop(self):
+        if multiprocess:
+            self.acquisition.stop()
+        if history is not None:
+            history.stop()
+        if acquisition.journal is not None:
+            acquisition.journal.stop()
+
+    def start_instrumentation(self, dashboard):
+        from kivy.core.window import Window
+        Window.bind(on_flip=monitor.frame_rendered)
+
+        if stats_file:
+            Clock.schedule_interval(lambda *args: monitor.dump(stats_file), 10)
+
+        if stats_overlay:
+            overlay = Label(text='', font_size=14, halign='left', valign='top', pos=(10, -10))
+            overlay.bind(size=overlay.setter('text_size'))
+            dashboard.add_widget(overlay)
+
+            def update_overlay(*args):
+                overlay.text = monitor.overlay_text()
+            Clock.schedule_interval(update_overlay, 1)
 
 
 if __name__ == "__main__":
-    # Send requests
-    RequestsLoop()
+    startup.mark('imports')
 
     _old_excepthook = sys.excepthook
 
@@ -453,4 +402,7 @@ if __name__ == "__main__":
     sys.excepthook = myexcepthook
 
     # Show dashboard
-    BoxApp().run()
+    if use_asyncio:
+        asyncio.run(BoxApp().async_run(async_lib='asyncio'))
+    else:
+        BoxApp().run()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+# Decoder registry for the UDS ReadDataByIdentifier (0x22) responses.
+#
+# Each signal is declared as data: the DID it answers, the byte layout of the
+# value in the response and a linear scaling (raw + offset) * factor / divisor.
+# The registry compiles one decode function per signal and dispatches on
+# (response arbitration id, DID) with a single dict lookup, so adding a PID
+# only needs a new Signal entry below. `rate` is the target poll rate in Hz.
+# `deadband` and `min_interval` limit how often a new value reaches the UI,
+# see signalstore.SignalState.
+
+
+message_commands = {
+    'GET_RPM': 0xF40C,
+    'GET_SPEED': 0xF40D,
+    'GET_DOORS_COMMAND': 0x220D,
+    'GET_OIL_TEMPERATURE': 0x202F,
+    'GET_OUTDOOR_TEMPERATURE': 0x1014,
+    'GET_INDOOR_TEMPERATURE': 0x2613,
+    'GET_COOLANT_TEMPERATURE': 0xF405,
+    'GET_KM_LEFT': 0x2294,
+    'GET_FUEL_LEFT': 0x229A,
+    'GET_TIME': 0x2216,
+    'GET_DISTANCE': 0x2203,
+    'GET_FUEL_CONSUMPTION': 0x2299
+}
+
+# diagnostic request id -> response id, one entry per ECU we talk to
+ecus = {
+    0x714: 0x77E,  # instrument cluster
+    0x746: 0x7B0,  # climate control
+}
+
+# single frame response: [length, 0x62, DID high, DID low, value...]
+VALUE_POSITION = 4
+
+READ_DATA_BY_IDENTIFIER = 0x22
+POSITIVE_RESPONSE = 0x40
+# negative response: [0x7F, service, code]; 0x78 means the answer is still coming
+NEGATIVE_RESPONSE = 0x7F
+RESPONSE_PENDING = 0x78
+
+# DIDs asked for in one ReadDataByIdentifier request, 1 disables batching.
+# 3 keeps the request in a single frame (service + 3 x 2 byte DIDs)
+MAX_DIDS_PER_REQUEST = 3
+
+
+class Layout(object):
+    # `unpack(data, pos)` reads the raw value, `pack(raw)` is its inverse (used by the simulator)
+    def __init__(self, name, size, unpack, pack):
+        self.name = name
+        self.size = size
+        self.unpack = unpack
+        self.pack = pack
+
+
+U8 = Layout('u8', 1, lambda data, pos=VALUE_POSITION: data[pos],
+            lambda raw: [max(0, min(0xFF, raw))])
+U16 = Layout('u16', 2, lambda data, pos=VALUE_POSITION: data[pos + 1] | data[pos] << 8,
+             lambda raw: [max(0, min(0xFFFF, raw)) >> 8, max(0, min(0xFFFF, raw)) & 0xFF])
+# hours and minutes, one byte each
+HOUR_MINUTE = Layout('hour_minute', 2, lambda data, pos=VALUE_POSITION: (data[pos], data[pos + 1]),
+                     lambda raw: [raw[0], raw[1]])
+
+
+class Signal(object):
+    def __init__(self, name, command, layout=U8, offset=0, factor=1, divisor=1, request_id=0x714, rate=1,
+                 deadband=0, min_interval=0):
+        self.name = name
+        self.command = command
+        self.layout = layout
+        self.offset = offset
+        self.factor = factor
+        self.divisor = divisor
+        self.request_id = request_id
+        self.response_id = ecus[request_id]
+        self.rate = rate
+        self.deadband = deadband
+        self.min_interval = min_interval
+        self.decode = self._compile()
+
+    def encode(self, value):
+        # value bytes of a response carrying `value`, the inverse of decode
+        if isinstance(value, tuple):
+            return self.layout.pack(value)
+        return self.layout.pack(int(round(value * self.divisor / float(self.factor) - self.offset)))
+
+    def _compile(self):
+        # build the cheapest function for this scaling, no-op steps are left out
+        unpack = self.layout.unpack
+        offset = self.offset
+        factor = self.factor
+        divisor = self.divisor
+
+        if offset == 0 and factor == 1 and divisor == 1:
+            return unpack
+        if factor == 1 and divisor == 1:
+            return lambda data, pos=VALUE_POSITION: unpack(data, pos) + offset
+        if offset == 0 and factor == 1:
+            return lambda data, pos=VALUE_POSITION: unpack(data, pos) / divisor
+        if offset == 0 and divisor == 1:
+            return lambda data, pos=VALUE_POSITION: unpack(data, pos) * factor
+        return lambda data, pos=VALUE_POSITION: (unpack(data, pos) + offset) * factor / divisor
+
+
+class PollGroup(object):
+    # signals of one ECU read together with a single multi-DID 0x22 request
+    def __init__(self, signals):
+        self.signals = signals
+        self.name = '+'.join(signal.name for signal in signals)
+        self.rate = max(signal.rate for signal in signals)
+        self.request_id = signals[0].request_id
+        self.response_id = signals[0].response_id
+        self.request = [READ_DATA_BY_IDENTIFIER]
+        for signal in signals:
+            self.request += [signal.command >> 8, signal.command & 0xff]
+
+
+class DecoderRegistry(object):
+    def __init__(self, signals=()):
+        self._signals = {}
+        self._by_name = {}
+        for signal in signals:
+            self.register(signal)
+
+    def register(self, signal):
+        self._signals[(signal.response_id, signal.command)] = signal
+        self._by_name[signal.name] = signal
+
+    def __iter__(self):
+        return iter(self._by_name.values())
+
+    def __getitem__(self, name):
+        return self._by_name[name]
+
+    def response_ids(self):
+        return sorted(set(signal.response_id for signal in self._by_name.values()))
+
+    def can_filters(self):
+        # exact match on every response id, the kernel drops everything else
+        return [{'can_id': response_id, 'can_mask': 0x7FF, 'extended': False}
+                for response_id in self.response_ids()]
+
+    def decode_payload(self, response_id, data, pos, end):
+        # UDS response in data[pos:end]: [0x62, DID, value, DID, value, ...]
+        # returns a list of (signal, value), parsing stops at the first unknown DID
+        decoded = []
+        if data[pos] != READ_DATA_BY_IDENTIFIER | POSITIVE_RESPONSE:
+            return decoded
+        pos += 1
+        signals = self._signals
+        while pos + 2 < end:
+            signal = signals.get((response_id, data[pos + 1] | data[pos] << 8))
+            if signal is None:
+                break
+            value_pos = pos + 2
+            pos = value_pos + signal.layout.size
+            if pos > end:
+                break
+            decoded.append((signal, signal.decode(data, value_pos)))
+        return decoded
+
+    def poll_groups(self, max_dids=MAX_DIDS_PER_REQUEST):
+        # signals of the same ECU polled at the same rate share one request;
+        # fast signals are usually alone in their group and stay single frame
+        groups = []
+        pending = {}
+        for signal in self._by_name.values():
+            key = (signal.request_id, signal.rate)
+            members = pending.setdefault(key, [])
+            if not members:
+                groups.append(members)
+            members.append(signal)
+            if len(members) == max_dids:
+                del pending[key]
+        return [PollGroup(members) for members in groups]
+
+
+registry = DecoderRegistry([
+    # the needle is interpolated between samples, see widgets.Gauge.smoothing
+    Signal('rpm', message_commands['GET_RPM'], U16, divisor=4, rate=25, deadband=25),
+    # polled at 20 Hz for the distance integral of the trip computer (TripComputer._speed),
+    # the readout itself changes at most 4 times a second
+    Signal('speed', message_commands['GET_SPEED'], rate=20, min_interval=0.25),
+    Signal('doors', message_commands['GET_DOORS_COMMAND'], rate=5),
+    Signal('km_left', message_commands['GET_KM_LEFT'], U16, rate=0.5),
+    Signal('oil_temperature', message_commands['GET_OIL_TEMPERATURE'], offset=-58),
+    # 55L = 256 * 8
+    Signal('fuel_left', message_commands['GET_FUEL_LEFT'], U16, divisor=8, rate=0.2),
+    Signal('outdoor_temperature', message_commands['GET_OUTDOOR_TEMPERATURE'], offset=-100, divisor=2, rate=0.5,
+           deadband=0.5),
+    # climate control, assumed to use the same encoding as the outdoor sensor
+    Signal('indoor_temperature', message_commands['GET_INDOOR_TEMPERATURE'], offset=-100, divisor=2,
+           request_id=0x746, rate=0.5, deadband=0.5),
+    Signal('coolant_temperature', message_commands['GET_COOLANT_TEMPERATURE'], offset=-63, factor=1.5, divisor=2),
+    Signal('time', message_commands['GET_TIME'], HOUR_MINUTE),
+    Signal('distance', message_commands['GET_DISTANCE'], U16, factor=10, rate=0.5),
+    Signal('fuel_consumption', message_commands['GET_FUEL_CONSUMPTION'], U16, divisor=10),
+])
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+
+class FrameGovernor(object):
+    # Runs the Kivy clock at `full_fps` while something on the dashboard moves and at
+    # `idle_fps` once everything has been still for `hold` seconds. Kivy only redraws
+    # when a canvas changed, so at the idle rate the main loop mostly sleeps. The price
+    # is up to 1 / idle_fps of delay on the first change after a quiet period.
+    def __init__(self, clock, full_fps=60, idle_fps=5, hold=2.0):
+        self.clock = clock
+        self.full_fps = full_fps
+        self.idle_fps = idle_fps
+        self.hold = hold
+        self.idle = False
+        self.animations = 0
+        self._until = time.monotonic() + hold
+
+    def _set_fps(self, fps):
+        # Kivy has no setter, this is the value it reads from Config graphics/maxfps
+        self.clock._max_fps = float(fps)
+
+    def boost(self, *args):
+        self._until = time.monotonic() + self.hold
+        if self.idle:
+            self.idle = False
+            self._set_fps(self.full_fps)
+
+    def track(self, animation):
+        # full rate until `animation` completes
+        self.animations += 1
+        self.boost()
+        animation.bind(on_complete=self._animation_done)
+
+    def _animation_done(self, *args):
+        self.animations -= 1
+        self.boost()
+
+    def update(self, *args):
+        # called once per frame
+        if not self.idle and not self.animations and time.monotonic() > self._until:
+            self.idle = True
+            self._set_fps(self.idle_fps)
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+# Drive history: an append-only columnar store of decoded signal values.
+#
+# Every numeric signal has three files in the history directory:
+#   <name>.t    f64 time.time() of each sample
+#   <name>.v    f64 value of each sample
+#   <name>.idx  one record per complete chunk of CHUNK_SIZE samples:
+#               f64 first time, f64 last time, f64 min, f64 max, f64 sum, u32 count
+#
+# HistoryWriter.add() only appends to a deque; a background thread writes the
+# samples out every `flush_interval` seconds, one write per file, so the CAN and
+# UI threads never wait for the SD card and it sees few, large writes.
+# HistoryReader memory-maps the files and answers range queries from the chunk
+# index, only scanning the chunks that straddle the ends of the range. Queries
+# assume time.time() only moves forward while recording.
+#
+#   python history.py <dir> <signal> <from> <to>    e.g. history coolant_temperature 2026-10-13 2026-10-14
+
+import bisect
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import deque
+from datetime import datetime
+from threading import Thread, Event
+
+CHUNK_SIZE = 4096
+INDEX = struct.Struct('<dddddI4x')
+VALUE_SIZE = 8
+
+
+def _paths(directory, name):
+    base = os.path.join(directory, name)
+    return base + '.t', base + '.v', base + '.idx'
+
+
+def _chunk_summary(times, values):
+    return INDEX.pack(times[0], times[-1], min(values), max(values), sum(values), len(values))
+
+
+class HistoryWriter(object):
+    # `names` are the signals recorded, values of other signals are ignored
+    def __init__(self, directory, names, flush_interval=60.0):
+        self.directory = directory
+        self.names = frozenset(names)
+        self.flush_interval = flush_interval
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._pending = deque()
+        # samples of each signal's chunk that is not complete yet
+        self._chunks = {}
+        for name in self.names:
+            self._chunks[name] = self._recover(name)
+
+        self._stop = Event()
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _recover(self, name):
+        # cut the files back to the last sample written to both columns and to its
+        # complete chunks, returns the samples of the incomplete chunk
+        time_path, value_path, index_path = _paths(self.directory, name)
+        times, values = array('d'), array('d')
+        count = 0
+        if os.path.exists(time_path) and os.path.exists(value_path):
+            count = min(os.path.getsize(time_path), os.path.getsize(value_path)) // VALUE_SIZE
+        chunks = count // CHUNK_SIZE
+        for path, column in ((time_path, times), (value_path, values)):
+            with open(path, 'ab+') as column_file:
+                column_file.truncate(count * VALUE_SIZE)
+                column_file.seek(chunks * CHUNK_SIZE * VALUE_SIZE)
+                column.frombytes(column_file.read())
+        with open(index_path, 'ab+') as index_file:
+            indexed = os.path.getsize(index_path) // INDEX.size
+            index_file.truncate(min(indexed, chunks) * INDEX.size)
+            # chunks completed after the last index update
+            for chunk in range(min(indexed, chunks), chunks):
+                chunk_times, chunk_values = self._read_chunk(time_path, value_path, chunk)
+                index_file.write(_chunk_summary(chunk_times, chunk_values))
+        return times, values
+
+    def _read_chunk(self, time_path, value_path, chunk):
+        columns = []
+        for path in (time_path, value_path):
+            column = array('d')
+            with open(path, 'rb') as column_file:
+                column_file.seek(chunk * CHUNK_SIZE * VALUE_SIZE)
+                column.frombytes(column_file.read(CHUNK_SIZE * VALUE_SIZE))
+            columns.append(column)
+        return columns
+
+    def add(self, name, value, timestamp=None):
+        # called from the CAN thread, costs a deque append
+        if name in self.names:
+            self._pending.append((name, time.time() if timestamp is None else timestamp, value))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        # only called from the writer thread, or after stop()
+        batches = {}
+        pending = self._pending
+        while pending:
+            name, timestamp, value = pending.popleft()
+            times, values = batches.setdefault(name, (array('d'), array('d')))
+            times.append(timestamp)
+            values.append(value)
+
+        for name, (times, values) in batches.items():
+            time_path, value_path, index_path = _paths(self.directory, name)
+            with open(time_path, 'ab') as time_file:
+                times.tofile(time_file)
+            with open(value_path, 'ab') as value_file:
+                values.tofile(value_file)
+
+            # index the chunks completed by this batch
+            chunk_times, chunk_values = self._chunks[name]
+            chunk_times.extend(times)
+            chunk_values.extend(values)
+            if len(chunk_times) >= CHUNK_SIZE:
+                with open(index_path, 'ab') as index_file:
+                    while len(chunk_times) >= CHUNK_SIZE:
+                        index_file.write(_chunk_summary(chunk_times[:CHUNK_SIZE], chunk_values[:CHUNK_SIZE]))
+                        del chunk_times[:CHUNK_SIZE]
+                        del chunk_values[:CHUNK_SIZE]
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+
+class HistoryReader(object):
+    # Range queries over the files written by HistoryWriter, open the reader again
+    # to see samples flushed after it was opened.
+    def __init__(self, directory):
+        self.directory = directory
+        self._columns = {}
+
+    def _open(self, name):
+        columns = self._columns.get(name)
+        if columns is None:
+            mapped = []
+            for path, record_size in zip(_paths(self.directory, name), (VALUE_SIZE, VALUE_SIZE, INDEX.size)):
+                # whole records only, the writer may be appending
+                size = os.path.getsize(path) // record_size * record_size if os.path.exists(path) else 0
+                if not size:
+                    mapped.append(None)
+                    continue
+                with open(path, 'rb') as column_file:
+                    mapped.append(mmap.mmap(column_file.fileno(), size, access=mmap.ACCESS_READ))
+            time_map, value_map, index_map = mapped
+            times = memoryview(time_map).cast('d') if time_map is not None else []
+            values = memoryview(value_map).cast('d') if value_map is not None else []
+            count = min(len(times), len(values))
+            index = []
+            if index_map is not None:
+                index = [INDEX.unpack_from(index_map, offset)
+                         for offset in range(0, len(index_map) - INDEX.size + 1, INDEX.size)]
+            columns = self._columns[name] = (times, values, count, index)
+        return columns
+
+    def samples(self, name, start, end):
+        # [(time, value)] of `name` with start <= time < end
+        times, values, count, index = self._open(name)
+        first = bisect.bisect_left(times, start, 0, count)
+        last = bisect.bisect_left(times, end, first, count)
+        return list(zip(times[first:last], values[first:last]))
+
+    def summary(self, name, start, end):
+        # count, min, max and mean of the samples with start <= time < end, None when there are none
+        times, values, count, index = self._open(name)
+
+        def scan(first, last):
+            # samples [first, last) read from the columns
+            first = bisect.bisect_left(times, start, first, last)
+            last = bisect.bisect_left(times, end, first, last)
+            chunk = values[first:last]
+            if not len(chunk):
+                return 0, 0.0, None, None
+            return len(chunk), sum(chunk), min(chunk), max(chunk)
+
+        parts = []
+        # chunks ending before the range are skipped without being read
+        chunk = bisect.bisect_left([record[1] for record in index], start)
+        while chunk < len(index):
+            first_time, last_time, chunk_min, chunk_max, chunk_sum, chunk_count = index[chunk]
+            if first_time >= end:
+                break
+            if start <= first_time and last_time < end:
+                # chunk inside the range, answered by the index
+                parts.append((chunk_count, chunk_sum, chunk_min, chunk_max))
+            else:
+                parts.append(scan(chunk * CHUNK_SIZE, (chunk + 1) * CHUNK_SIZE))
+            chunk += 1
+        else:
+            # samples after the last complete chunk are not indexed
+            parts.append(scan(len(index) * CHUNK_SIZE, count))
+
+        parts = [part for part in parts if part[0]]
+        if not parts:
+            return None
+        total_count = sum(part[0] for part in parts)
+        return {
+            'count': total_count,
+            'min': min(part[2] for part in parts),
+            'max': max(part[3] for part in parts),
+            'mean': sum(part[1] for part in parts) / total_count,
+        }
+
+
+def main():
+    if len(sys.argv) != 5:
+        print('usage: python history.py <dir> <signal> <from> <to>    dates as YYYY-MM-DD[THH:MM]')
+        sys.exit(1)
+    directory, name, start, end = sys.argv[1:]
+
+    def parse(text):
+        for date_format in ('%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+            try:
+                return time.mktime(datetime.strptime(text, date_format).timetuple())
+            except ValueError:
+                pass
+        raise ValueError('invalid date %r' % text)
+
+    summary = HistoryReader(directory).summary(name, parse(start), parse(end))
+    if summary is None:
+        print('no %s samples in that range' % name)
+    else:
+        print('%s: %d samples, min %.2f, max %.2f, mean %.2f' % (name, summary['count'], summary['min'],
+                                                                summary['max'], summary['mean']))
+
+
+if __name__ == "__main__":
+    main()
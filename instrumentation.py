@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# End-to-end latency instrumentation, per signal:
+#   rtt        request sent (RequestsLoop / AsyncCanEngine) -> response received (CanListener)
+#   decode     response received -> value decoded and stored
+#   to_widget  response received -> widget property updated (Dashboard.apply_signals)
+#   to_screen  response received -> next frame flipped to the display
+#
+# Everything is recorded into fixed bucket histograms, a sample costs one bisect
+# and a few additions. When disabled the dashboards keep `monitor = None` and
+# every hook is a single `is not None` test.
+
+import bisect
+import json
+import time
+
+# bucket upper bounds in microseconds, four buckets per power of two from 1 us to ~8 s
+BOUNDS = [2 ** (i / 4.0) for i in range(4 * 23 + 1)]
+
+METRICS = ('rtt', 'decode', 'to_widget', 'to_screen')
+
+
+class Histogram(object):
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        self.counts[bisect.bisect_left(BOUNDS, us)] += 1
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+
+    def percentile(self, p):
+        # upper bound of the bucket holding the p-th percentile, in microseconds
+        if self.count == 0:
+            return 0.0
+        wanted = self.count * p / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return BOUNDS[index] if index < len(BOUNDS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_us': self.total / self.count if self.count else 0.0,
+            'p50_us': self.percentile(50),
+            'p95_us': self.percentile(95),
+            'p99_us': self.percentile(99),
+            'max_us': self.max,
+        }
+
+
+class LatencyMonitor(object):
+    def __init__(self):
+        self.histograms = {}
+        self._sent = {}
+        self._received = {}
+        self._applied = []
+
+    def _histogram(self, name, metric):
+        key = (name, metric)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    # CAN side
+
+    def request_sent(self, group):
+        now = time.monotonic()
+        for signal in group.signals:
+            self._sent[signal.name] = now
+
+    def response_received(self, name, received, decoded):
+        sent = self._sent.pop(name, None)
+        if sent is not None:
+            self._histogram(name, 'rtt').add(received - sent)
+        self._histogram(name, 'decode').add(decoded - received)
+        self._received[name] = received
+
+    # UI side
+
+    def signals_applied(self, names):
+        now = time.monotonic()
+        for name in names:
+            received = self._received.get(name)
+            if received is not None:
+                self._histogram(name, 'to_widget').add(now - received)
+                self._applied.append((name, received))
+
+    def frame_rendered(self, *args):
+        # bound to Window.on_flip
+        if not self._applied:
+            return
+        now = time.monotonic()
+        for name, received in self._applied:
+            self._histogram(name, 'to_screen').add(now - received)
+        self._applied = []
+
+    # reporting
+
+    def summary(self):
+        stats = {}
+        # a copy: the CAN thread adds histograms for signals seen for the first time
+        for (name, metric), histogram in list(self.histograms.items()):
+            stats.setdefault(name, {})[metric] = histogram.summary()
+        return stats
+
+    def overlay_text(self, names=('rpm', 'speed', 'doors')):
+        lines = []
+        for name in names:
+            parts = [name]
+            for metric in METRICS:
+                histogram = self.histograms.get((name, metric))
+                if histogram is not None and histogram.count:
+                    parts.append('%s %.2f/%.2f ms' % (metric, histogram.percentile(50) / 1000.0,
+                                                      histogram.percentile(95) / 1000.0))
+            lines.append('  '.join(parts))
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        with open(path, 'w') as stats_file:
+            json.dump(self.summary(), stats_file, indent=2, sort_keys=True)
+
+
+class StartupTimer(object):
+    # Duration of each startup phase, from `start` (time.monotonic() at the top of the
+    # dashboard module) to the end of the phase passed to mark().
+    def __init__(self, start):
+        self.start = start
+        self.phases = []
+        self._last = start
+
+    def mark(self, phase):
+        now = time.monotonic()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def elapsed(self):
+        return self._last - self.start
+
+    def report(self):
+        parts = ['%s %.3f s' % phase for phase in self.phases]
+        return 'startup: %s, total %.3f s' % (', '.join(parts), self.elapsed())
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# Minimal ISO-TP (ISO 15765-2) transport for normal 11 bit addressing.
+#
+# Frames are classified by the high nibble of the first byte:
+#   0 single frame       [0x0L, payload...]
+#   1 first frame        [0x1L, LL, payload...]       L = 12 bit length
+#   2 consecutive frame  [0x2N, payload...]           N = sequence number
+#   3 flow control       [0x3S, block size, STmin]    S = flow status
+
+import time
+from threading import Event
+
+SINGLE_FRAME = 0x0
+FIRST_FRAME = 0x1
+CONSECUTIVE_FRAME = 0x2
+FLOW_CONTROL = 0x3
+
+FLOW_CONTINUE = 0x0
+FLOW_WAIT = 0x1
+
+# time to wait for the ECU's flow control frame (N_Bs)
+FLOW_CONTROL_TIMEOUT = 1.0
+
+
+def separation_time(st_min):
+    # STmin byte to seconds: 0x00-0x7F milliseconds, 0xF1-0xF9 100-900 microseconds
+    if st_min <= 0x7F:
+        return st_min / 1000.0
+    if 0xF1 <= st_min <= 0xF9:
+        return (st_min - 0xF0) / 10000.0
+    return 0.127
+
+
+class IsoTpChannel(object):
+    # One request/response id pair. `send_frame(arbitration_id, data)` puts a frame on the bus.
+    def __init__(self, send_frame, request_id, response_id, padding=0x55):
+        self.send_frame = send_frame
+        self.request_id = request_id
+        self.response_id = response_id
+        self.padding = padding
+
+        # receiving
+        self._buffer = None
+        self._length = 0
+        self._sequence = 0
+
+        # sending
+        self._flow = Event()
+        self._flow_status = FLOW_CONTINUE
+        self._block_size = 0
+        self._st_min = 0
+
+    def _pad(self, data):
+        return data + [self.padding] * (8 - len(data))
+
+    def send(self, payload):
+        # returns False when the ECU did not accept a multi frame transfer
+        payload = list(payload)
+        length = len(payload)
+        if length <= 7:
+            self.send_frame(self.request_id, self._pad([length] + payload))
+            return True
+
+        self._flow.clear()
+        self.send_frame(self.request_id, [FIRST_FRAME << 4 | length >> 8, length & 0xFF] + payload[:6])
+        position = 6
+        sequence = 1
+        while position < length:
+            if not self._wait_flow():
+                return False
+            block = 0
+            while position < length and (self._block_size == 0 or block < self._block_size):
+                if block > 0:
+                    time.sleep(separation_time(self._st_min))
+                self.send_frame(self.request_id,
+                                self._pad([CONSECUTIVE_FRAME << 4 | sequence] + payload[position:position + 7]))
+                position += 7
+                sequence = (sequence + 1) & 0x0F
+                block += 1
+        return True
+
+    def _wait_flow(self):
+        while True:
+            if not self._flow.wait(FLOW_CONTROL_TIMEOUT):
+                return False
+            self._flow.clear()
+            if self._flow_status == FLOW_CONTINUE:
+                return True
+            if self._flow_status != FLOW_WAIT:
+                # overflow or unknown status, abort
+                return False
+
+    def on_frame(self, data):
+        # feed a frame received on response_id, returns the payload once it is complete
+        frame_type = data[0] >> 4
+
+        if frame_type == SINGLE_FRAME:
+            self._buffer = None
+            return bytearray(data[1:1 + (data[0] & 0x0F)])
+
+        if frame_type == FIRST_FRAME:
+            self._length = (data[0] & 0x0F) << 8 | data[1]
+            self._buffer = bytearray(data[2:8])
+            self._sequence = 1
+            try:
+                # clear to send everything, no separation time
+                self.send_frame(self.request_id, self._pad([FLOW_CONTROL << 4 | FLOW_CONTINUE, 0x00, 0x00]))
+            except Exception:
+                self._buffer = None
+            return None
+
+        if frame_type == CONSECUTIVE_FRAME:
+            if self._buffer is None:
+                return None
+            if data[0] & 0x0F != self._sequence:
+                # lost a frame, drop the whole transfer
+                self._buffer = None
+                return None
+            self._buffer.extend(data[1:8])
+            self._sequence = (self._sequence + 1) & 0x0F
+            if len(self._buffer) >= self._length:
+                payload = self._buffer[:self._length]
+                self._buffer = None
+                return payload
+            return None
+
+        if frame_type == FLOW_CONTROL:
+            self._flow_status = data[0] & 0x0F
+            self._block_size = data[1]
+            self._st_min = data[2]
+            self._flow.set()
+
+        return None
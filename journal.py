@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# Append-only binary journal of CAN frames and a bus that replays it.
+#
+# File layout: an 8 byte header followed by fixed size little endian records.
+#   header  magic b'CARJ', u16 version, u16 record size
+#   record  f64 monotonic timestamp, u32 arbitration id, u8 dlc, u8 flags, 2 pad bytes, 8 data bytes
+# flags bit 0 marks frames we sent (requests), everything else was received.
+# Every run appends to the file and the timestamps restart at each boot, so the
+# replay restarts its clock where they go backwards or jump (a new session).
+
+import os
+import struct
+import time
+from threading import Lock, Thread, Event
+
+import can
+
+MAGIC = b'CARJ'
+VERSION = 1
+HEADER = struct.Struct('<4sHH')
+RECORD = struct.Struct('<dIBB2x8s')
+
+FLAG_SENT = 0x01
+
+# a gap between two frames longer than this is replayed as a new session, seconds
+SESSION_GAP = 5.0
+
+
+def read_journal(path):
+    # yields (timestamp, arbitration_id, dlc, flags, data) tuples
+    with open(path, 'rb') as journal_file:
+        magic, version, record_size = HEADER.unpack(journal_file.read(HEADER.size))
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError('%s is not a frame journal' % path)
+        while True:
+            record = journal_file.read(RECORD.size)
+            if len(record) < RECORD.size:
+                return
+            yield RECORD.unpack(record)
+
+
+class FrameJournal(can.Listener):
+    # Attach to the Notifier for received frames; record_sent() logs our own requests.
+    # Records are buffered and synced to disk every `flush_interval` seconds by a
+    # thread of its own, a power cut loses at most that much.
+    def __init__(self, path, buffering=64 * 1024, flush_interval=1.0):
+        self._lock = Lock()
+        self._file = open(path, 'ab', buffering)
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.flush_interval = flush_interval
+        self._stop = Event()
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            with self._lock:
+                self._file.flush()
+            # the CAN threads only wait for the buffer flush, not for the SD card
+            os.fsync(self._file.fileno())
+
+    def _write(self, arbitration_id, data, flags):
+        record = RECORD.pack(time.monotonic(), arbitration_id, len(data), flags, bytes(bytearray(data)))
+        with self._lock:
+            self._file.write(record)
+
+    def on_message_received(self, message):
+        self._write(message.arbitration_id, message.data, 0)
+
+    def record_sent(self, arbitration_id, data):
+        self._write(arbitration_id, data, FLAG_SENT)
+
+    def stop(self):
+        # also called by Notifier.stop()
+        self._stop.set()
+        self._thread.join()
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+class ReplayBus(can.BusABC):
+    # Plays the received frames of a journal back with their original spacing.
+    # speed 1 is real time, 4 is four times faster and 0 replays as fast as possible.
+    # Frames sent to this bus are dropped, so no can0 interface is needed.
+    def __init__(self, path, speed=1.0, **kwargs):
+        self.channel_info = 'replay of %s' % path
+        self.speed = speed
+        self._records = read_journal(path)
+        self._first_timestamp = None
+        self._last_timestamp = None
+        self._start = None
+        super(ReplayBus, self).__init__(channel=path, **kwargs)
+
+    def _recv_internal(self, timeout):
+        for timestamp, arbitration_id, dlc, flags, data in self._records:
+            if flags & FLAG_SENT:
+                continue
+
+            if self.speed > 0:
+                if (self._first_timestamp is None or timestamp < self._last_timestamp
+                        or timestamp - self._last_timestamp > SESSION_GAP):
+                    # first frame of a session
+                    self._first_timestamp = timestamp
+                    self._start = time.monotonic()
+                self._last_timestamp = timestamp
+                delay = self._start + (timestamp - self._first_timestamp) / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            message = can.Message(timestamp=time.time(), arbitration_id=arbitration_id,
+                                  data=data[:dlc], is_extended_id=False)
+            return message, False
+
+        # end of the journal
+        if timeout is None or timeout > 0:
+            time.sleep(timeout or 1.0)
+        return None, False
+
+    def send(self, msg, timeout=None):
+        pass
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import time
+from threading import Event
+
+from decoders import PollGroup, RESPONSE_PENDING
+
+
+class PollScheduler(object):
+    # Earliest-deadline-first request scheduling with a target rate per poll group
+    # (see decoders.PollGroup). The next request goes out as soon as the previous
+    # one is answered, or after `timeout` seconds without an answer, so the gateway
+    # never has more than one request in flight and the fast signals get every free slot.
+    def __init__(self, groups, timeout=0.05):
+        self.timeout = timeout
+        self._groups = []
+        self._group_of = {}
+        self._queue = []
+        self._answered = Event()
+        self._pending = None
+        # batched group the ECU would not answer, split by the requesting thread
+        self._failed = None
+        self._reported = set()
+
+        now = time.monotonic()
+        for order, group in enumerate(groups):
+            self._groups.append((group, 1.0 / group.rate))
+            for signal in group.signals:
+                self._group_of[signal.name] = group
+            heapq.heappush(self._queue, (now, order))
+
+    def group_of(self, name):
+        return self._group_of.get(name)
+
+    def pop_due(self):
+        # earliest group and the time until it is due; its next deadline is booked right away.
+        # Absolute deadlines do not drift; a late group is not allowed to burst to catch up.
+        deadline, order = self._queue[0]
+        group, period = self._groups[order]
+        now = time.monotonic()
+        heapq.heapreplace(self._queue, (max(deadline + period, now), order))
+        return group, deadline - now
+
+    def next_due(self):
+        # block until the earliest deadline and return that group
+        group, delay = self.pop_due()
+        if delay > 0:
+            time.sleep(delay)
+        return group
+
+    def request_sent(self, group):
+        self._pending = group
+        self._answered.clear()
+
+    def response_received(self, name):
+        # any signal of the pending group answers the whole request
+        if self._pending is not None and self._group_of.get(name) is self._pending:
+            self._answered.set()
+
+    def negative_response(self, response_id, service, code):
+        # 0x7F response to the pending request: a batched group is split into single
+        # DID requests, in case the ECU does not support multi DID reads
+        group = self._pending
+        if code == RESPONSE_PENDING or group is None or group.response_id != response_id:
+            return
+        if len(group.signals) > 1:
+            self._failed = group
+        elif group.name not in self._reported:
+            self._reported.add(group.name)
+            print('%s: negative response 0x%02X to service 0x%02X' % (group.name, code, service))
+        self._answered.set()
+
+    def request_failed(self, group):
+        # the request could not be sent, e.g. no flow control for a multi frame request
+        if len(group.signals) > 1:
+            self._failed = group
+
+    def wait_response(self):
+        answered = self._answered.wait(self.timeout)
+        self._pending = None
+        if self._failed is not None:
+            self.split(self._failed)
+            self._failed = None
+        return answered
+
+    def split(self, group):
+        # poll every signal of `group` on its own from now on, at the group's rate
+        for order, (scheduled, period) in enumerate(self._groups):
+            if scheduled is group:
+                break
+        else:
+            return
+        print('%s: batched request failed, polling the signals one by one' % group.name)
+        now = time.monotonic()
+        singles = [PollGroup([signal]) for signal in group.signals]
+        self._groups[order] = (singles[0], period)
+        for single in singles:
+            if single is not singles[0]:
+                self._groups.append((single, period))
+                heapq.heappush(self._queue, (now, len(self._groups) - 1))
+            self._group_of[single.signals[0].name] = single
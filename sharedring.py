@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+# Decoded signal values for other local processes: a single writer ring buffer in
+# a memory-mapped file (put it on /dev/shm), read without locks by any number of
+# readers, each with its own cursor. The writer never waits for a reader; a reader
+# that falls more than `capacity` records behind skips to the oldest record still
+# in the ring and counts the records it lost.
+#
+# File layout, little endian, offsets in bytes:
+#   0    header   4s magic b'CARR', u16 version, u16 record size, u32 capacity, u32 name count
+#   16   u64      head: number of records written so far
+#   24   f64      time.time() the file was created
+#   64   names    name count x 32 bytes, utf-8 signal names padded with zero bytes
+#   ...  records  capacity x 32 bytes, starting at the next multiple of 64:
+#        u64 seq, f64 time (time.time() unless given to publish()), u16 name index, u8 flags, 5 pad bytes, f64 value
+#
+# Record n (counting from 0) is in slot n % capacity and holds seq n + 1 once it
+# is complete. The writer sets seq to 0, writes the record, sets seq and then the
+# head. A reader takes a record when seq matches before and after reading it,
+# otherwise the writer has lapped it. Flags: 1 the value is an integer, 2 the value
+# is a pair (hours, minutes) stored as first * 256 + second.
+#
+# RingReader below is the reader library; other languages only need the layout.
+#
+#   python sharedring.py /dev/shm/car_signals      print the records as they arrive
+
+import mmap
+import os
+import struct
+import sys
+import time
+
+MAGIC = b'CARR'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+HEAD = struct.Struct('<Q')
+HEAD_OFFSET = 16
+CREATED = struct.Struct('<d')
+CREATED_OFFSET = 24
+NAMES_OFFSET = 64
+NAME_SIZE = 32
+SEQ = struct.Struct('<Q')
+BODY = struct.Struct('<dHB5xd')
+RECORD_SIZE = SEQ.size + BODY.size
+
+FLAG_INT = 1
+FLAG_PAIR = 2
+
+
+def _records_offset(name_count):
+    end = NAMES_OFFSET + name_count * NAME_SIZE
+    return (end + 63) // 64 * 64
+
+
+class RingWriter(object):
+    # `names` are all the signals that will be published, in a fixed order. The
+    # file is built aside and renamed over `path`, readers of a previous file
+    # see it replaced (RingReader.replaced()).
+    def __init__(self, path, names, capacity=4096):
+        self.names = list(names)
+        self.capacity = capacity
+        self._indexes = dict((name, index) for index, name in enumerate(self.names))
+        self._records = _records_offset(len(self.names))
+        self._head = 0
+
+        size = self._records + capacity * RECORD_SIZE
+        temporary = '%s.%d' % (path, os.getpid())
+        fd = os.open(temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, RECORD_SIZE, capacity, len(self.names))
+        CREATED.pack_into(self._map, CREATED_OFFSET, time.time())
+        for index, name in enumerate(self.names):
+            struct.pack_into('32s', self._map, NAMES_OFFSET + index * NAME_SIZE, name.encode('utf-8'))
+        os.rename(temporary, path)
+
+    def publish(self, name, value, timestamp=None):
+        # called from the CAN thread only, a few struct packs into the mapping
+        index = self._indexes.get(name)
+        if index is None:
+            return
+        if isinstance(value, tuple):
+            flags, value = FLAG_PAIR, value[0] * 256 + value[1]
+        elif isinstance(value, int):
+            flags = FLAG_INT
+        else:
+            flags = 0
+        offset = self._records + self._head % self.capacity * RECORD_SIZE
+        self._head += 1
+        mapped = self._map
+        SEQ.pack_into(mapped, offset, 0)
+        BODY.pack_into(mapped, offset + SEQ.size, time.time() if timestamp is None else timestamp, index, flags,
+                       value)
+        SEQ.pack_into(mapped, offset, self._head)
+        HEAD.pack_into(mapped, HEAD_OFFSET, self._head)
+
+    def close(self):
+        self._map.close()
+
+
+class RingReader(object):
+    # Reads the records published after it was opened (from the oldest record still
+    # in the ring with `from_start`). Records are unpacked straight from the mapping.
+    def __init__(self, path, from_start=False):
+        self.path = path
+        with open(path, 'rb') as ring_file:
+            self._map = mmap.mmap(ring_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._inode = os.fstat(ring_file.fileno()).st_ino
+        magic, version, record_size, self.capacity, name_count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+            raise ValueError('%s is not a signal ring' % path)
+        self.names = [struct.unpack_from('32s', self._map, NAMES_OFFSET + index * NAME_SIZE)[0]
+                      .rstrip(b'\0').decode('utf-8') for index in range(name_count)]
+        self._records = _records_offset(name_count)
+        self.created = CREATED.unpack_from(self._map, CREATED_OFFSET)[0]
+        head = self.head()
+        self.cursor = max(0, head - self.capacity) if from_start else head
+        # records overwritten before this reader got to them
+        self.lost = 0
+
+    def head(self):
+        return HEAD.unpack_from(self._map, HEAD_OFFSET)[0]
+
+    def _skip_lapped(self, head):
+        oldest = head - self.capacity
+        if self.cursor < oldest:
+            self.lost += oldest - self.cursor
+            self.cursor = oldest
+
+    def read(self, limit=None):
+        # [(time, name, value)] published since the last call, at most `limit`
+        records = []
+        mapped = self._map
+        head = self.head()
+        self._skip_lapped(head)
+        while self.cursor < head and (limit is None or len(records) < limit):
+            offset = self._records + self.cursor % self.capacity * RECORD_SIZE
+            expected = self.cursor + 1
+            seq = SEQ.unpack_from(mapped, offset)[0]
+            timestamp, index, flags, value = BODY.unpack_from(mapped, offset + SEQ.size)
+            if seq != expected or SEQ.unpack_from(mapped, offset)[0] != expected:
+                # overwritten by the writer while we were behind
+                head = self.head()
+                self._skip_lapped(max(head, self.cursor + self.capacity + 1))
+                continue
+            if flags & FLAG_PAIR:
+                value = (int(value) >> 8, int(value) & 0xFF)
+            elif flags & FLAG_INT:
+                value = int(value)
+            records.append((timestamp, self.names[index], value))
+            self.cursor = expected
+        return records
+
+    def replaced(self):
+        # True once the writer has restarted with a new file, open a new reader then
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except OSError:
+            return True
+
+    def close(self):
+        self._map.close()
+
+
+def main():
+    if len(sys.argv) != 2:
+        print('usage: python sharedring.py <ring file>')
+        sys.exit(1)
+    reader = RingReader(sys.argv[1])
+    while True:
+        for timestamp, name, value in reader.read():
+            print('%.3f %-24s %s' % (timestamp, name, value))
+        if reader.replaced():
+            reader = RingReader(sys.argv[1], from_start=True)
+        time.sleep(0.05)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import time
+from threading import Lock
+
+
+class SignalStore(object):
+    # Latest value per signal, written from the CAN thread and read from the UI thread.
+    # Only the newest value of each signal is kept, so however many responses
+    # arrive between two frames the UI applies each signal at most once.
+    def __init__(self):
+        self._lock = Lock()
+        self._values = {}
+        self._times = {}
+        self._changed = {}
+
+    def set(self, name, value, timestamp=None):
+        # `timestamp`: time.monotonic() the value was received, now by default
+        now = time.monotonic() if timestamp is None else timestamp
+        with self._lock:
+            self._values[name] = value
+            self._times[name] = now
+            self._changed[name] = value
+
+    def get(self, name, default=None):
+        with self._lock:
+            return self._values.get(name, default)
+
+    def values(self):
+        # copy of the latest value of every signal
+        with self._lock:
+            return dict(self._values)
+
+    def timestamp(self, name):
+        # time.monotonic() the latest value was received, None before the first one
+        return self._times.get(name)
+
+    def take_changed(self):
+        # hand over the pending values and start a new batch
+        with self._lock:
+            changed = self._changed
+            self._changed = {}
+        return changed
+
+
+class SignalState(object):
+    # Last value of one signal passed on to the UI. A new value is passed on when it
+    # differs from it by more than `deadband` (any difference for tuples) and at least
+    # `min_interval` seconds after it. Suppressed values are not queued: the next
+    # sample is compared with the last value passed on again.
+    __slots__ = ('deadband', 'min_interval', 'value', 'time')
+
+    def __init__(self, deadband=0, min_interval=0):
+        self.deadband = deadband
+        self.min_interval = min_interval
+        self.value = None
+        self.time = None
+
+    def update(self, value, now):
+        # True when `value` is passed on and becomes the last value
+        last = self.value
+        if last is not None:
+            if value == last:
+                return False
+            if self.deadband and not isinstance(value, tuple) and abs(value - last) <= self.deadband:
+                return False
+            if self.min_interval and now - self.time < self.min_interval:
+                return False
+        self.value = value
+        self.time = now
+        return True
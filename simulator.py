@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# Virtual ECU answering the dashboard's ReadDataByIdentifier requests.
+#
+# Runs on python-can's `virtual` interface (in process, see CAR_SIMULATOR in main.py)
+# or on a SocketCAN interface such as vcan0 as a separate process:
+#
+#   sudo ip link add dev vcan0 type vcan && sudo ip link set up vcan0
+#   python simulator.py --channel vcan0 --cycle demo
+#   CAR_CHANNEL=vcan0 python main.py
+#
+# Values follow a scripted drive cycle and are encoded with the same Signal
+# definitions the dashboard decodes them with.
+
+import argparse
+import datetime
+import random
+import time
+from threading import Thread, Condition
+
+import can
+
+from decoders import registry, ecus, READ_DATA_BY_IDENTIFIER, POSITIVE_RESPONSE, NEGATIVE_RESPONSE
+from isotp import IsoTpChannel
+
+REQUEST_OUT_OF_RANGE = 0x31
+
+# values of a parked car with the engine idling
+DEFAULT_VALUES = {
+    'rpm': 800,
+    'speed': 0,
+    'doors': 0x55,
+    'km_left': 520,
+    'oil_temperature': 90,
+    'fuel_left': 40,
+    'outdoor_temperature': 15,
+    'indoor_temperature': 21,
+    'coolant_temperature': 90,
+    'distance': 123450,
+    'fuel_consumption': 7.5,
+}
+
+# signals that jump between keyframes instead of being interpolated
+STEP_SIGNALS = ('doors',)
+
+
+class DriveCycle(object):
+    # Keyframes [(seconds, {signal: value}), ...]; unspecified signals keep their
+    # previous value, numeric signals are interpolated linearly and the cycle loops.
+    def __init__(self, keyframes):
+        self.times = []
+        self.frames = []
+        values = dict(DEFAULT_VALUES)
+        for t, changes in keyframes:
+            values = dict(values, **changes)
+            self.times.append(t)
+            self.frames.append(values)
+        self.duration = self.times[-1]
+
+    def values(self, t):
+        t = t % self.duration if self.duration > 0 else 0
+        index = 0
+        while index < len(self.times) - 2 and self.times[index + 1] <= t:
+            index += 1
+        start, end = self.frames[index], self.frames[index + 1]
+        span = self.times[index + 1] - self.times[index]
+        ratio = (t - self.times[index]) / span if span > 0 else 1.0
+
+        values = {}
+        for name, value in start.items():
+            if name in STEP_SIGNALS:
+                values[name] = value
+            else:
+                values[name] = value + (end[name] - value) * ratio
+
+        now = datetime.datetime.now()
+        values['time'] = (now.hour, now.minute)
+        return values
+
+
+CYCLES = {
+    'idle': DriveCycle([(0, {}), (10, {})]),
+    'acceleration': DriveCycle([
+        (0, {'rpm': 800, 'speed': 0}),
+        (2, {'rpm': 800, 'speed': 0}),
+        (8, {'rpm': 6000, 'speed': 100}),
+        (9, {'rpm': 2500, 'speed': 100}),
+        (14, {'rpm': 800, 'speed': 0}),
+    ]),
+    # bit set = door closed: driver opens, then the passenger, then all four, then everything closes
+    'doors': DriveCycle([
+        (0, {'doors': 0x55}),
+        (2, {'doors': 0x54}),
+        (4, {'doors': 0x50}),
+        (6, {'doors': 0x00}),
+        (8, {'doors': 0x55}),
+        (10, {'doors': 0x55}),
+    ]),
+    'fuel_drain': DriveCycle([
+        (0, {'fuel_left': 55, 'km_left': 800}),
+        (60, {'fuel_left': 0, 'km_left': 0}),
+    ]),
+    'demo': DriveCycle([
+        (0, {'doors': 0x54, 'rpm': 0}),
+        (3, {'doors': 0x55, 'rpm': 0}),
+        (4, {'rpm': 800}),
+        (6, {'rpm': 800, 'speed': 0}),
+        (12, {'rpm': 5500, 'speed': 90, 'fuel_left': 39.5}),
+        (14, {'rpm': 2200, 'speed': 90}),
+        (24, {'rpm': 2200, 'speed': 90, 'fuel_left': 39}),
+        (30, {'rpm': 800, 'speed': 0, 'fuel_left': 39}),
+    ]),
+}
+
+
+class VirtualEcu(Thread):
+    # Answers every ECU in decoders.ecus after `latency` +- `jitter` seconds
+    def __init__(self, bus, cycle, latency=0.002, jitter=0.001):
+        Thread.__init__(self)
+        self.daemon = True
+        self.bus = bus
+        self.cycle = cycle
+        self.latency = latency
+        self.jitter = jitter
+        self._start = time.monotonic()
+        self._responses = []
+        self._condition = Condition()
+        self._channels = dict((request_id, IsoTpChannel(self._send_frame, response_id, request_id))
+                              for request_id, response_id in ecus.items())
+        self._signals = dict(((signal.request_id, signal.command), signal) for signal in registry)
+        Thread(target=self._respond_loop, daemon=True).start()
+
+    def _send_frame(self, arbitration_id, data):
+        self.bus.send(can.Message(arbitration_id=arbitration_id, data=data, is_extended_id=False))
+
+    def response(self, request_id, request):
+        # UDS response payload for a ReadDataByIdentifier request payload
+        if len(request) < 3 or request[0] != READ_DATA_BY_IDENTIFIER:
+            return [NEGATIVE_RESPONSE, request[0] if request else 0, REQUEST_OUT_OF_RANGE]
+
+        values = self.cycle.values(time.monotonic() - self._start)
+        response = [READ_DATA_BY_IDENTIFIER | POSITIVE_RESPONSE]
+        for pos in range(1, len(request) - 1, 2):
+            signal = self._signals.get((request_id, request[pos] << 8 | request[pos + 1]))
+            if signal is None:
+                return [NEGATIVE_RESPONSE, READ_DATA_BY_IDENTIFIER, REQUEST_OUT_OF_RANGE]
+            response += [request[pos], request[pos + 1]] + signal.encode(values[signal.name])
+        return response
+
+    def run(self):
+        while True:
+            message = self.bus.recv(1.0)
+            if message is None:
+                continue
+            channel = self._channels.get(message.arbitration_id)
+            if channel is None:
+                continue
+            request = channel.on_frame(message.data)
+            if request is None:
+                continue
+
+            delay = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+            with self._condition:
+                self._responses.append((time.monotonic() + delay, channel, self.response(message.arbitration_id, request)))
+                self._condition.notify()
+
+    def _respond_loop(self):
+        # separate thread: multi frame responses wait for the dashboard's flow control
+        while True:
+            with self._condition:
+                while not self._responses:
+                    self._condition.wait()
+                due, channel, response = self._responses.pop(0)
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                channel.send(response)
+            except can.CanError:
+                pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Virtual ECU for the dashboard')
+    parser.add_argument('--interface', default='socketcan')
+    parser.add_argument('--channel', default='vcan0')
+    parser.add_argument('--cycle', default='demo', choices=sorted(CYCLES))
+    parser.add_argument('--latency', type=float, default=0.002, help='response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.001, help='+- latency jitter in seconds')
+    args = parser.parse_args()
+
+    ecu = VirtualEcu(can.interface.Bus(channel=args.channel, bustype=args.interface), CYCLES[args.cycle],
+                     latency=args.latency, jitter=args.jitter)
+    ecu.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+# Last known value of every signal, checkpointed into a small memory-mapped file
+# so that the dashboard starts with the values of the previous drive instead of
+# placeholders.
+#
+#   header  '<4sHHd'   magic b'CARS', version, slot count, time.time() of the last save
+#   slot    '<HBB4s'   DID, flags, raw size, raw value as sent by the ECU
+#
+# One slot per registry signal, in registry order. Values are stored raw
+# (Signal.encode) and read back with Signal.decode; slots are matched by DID, so
+# a file written before a registry change is still read.
+
+import mmap
+import os
+import struct
+import time
+
+HEADER = struct.Struct('<4sHHd')
+SLOT = struct.Struct('<HBB4s')
+MAGIC = b'CARS'
+VERSION = 1
+FLAG_VALID = 1
+
+# wrong as soon as the car has been switched off, never restored
+LIVE_ONLY = ('rpm', 'speed', 'doors', 'time')
+
+
+def read_snapshot(path, registry, skip=LIVE_ONLY):
+    # {signal name: value} stored in `path`, empty when there is no usable file
+    try:
+        with open(path, 'rb') as snapshot_file:
+            data = snapshot_file.read()
+    except IOError:
+        return {}
+    if len(data) < HEADER.size:
+        return {}
+    magic, version, count, saved = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or len(data) < HEADER.size + count * SLOT.size:
+        return {}
+
+    signals = dict((signal.command, signal) for signal in registry)
+    values = {}
+    for index in range(count):
+        command, flags, size, raw = SLOT.unpack_from(data, HEADER.size + index * SLOT.size)
+        signal = signals.get(command)
+        if signal is None or not flags & FLAG_VALID or signal.name in skip:
+            continue
+        values[signal.name] = signal.decode(bytearray(raw[:size]), 0)
+    return values
+
+
+class StateSnapshot(object):
+    # Writer side. The file is rewritten with the current registry layout on open,
+    # keeping the values it held; save() then only packs into the mapping.
+    def __init__(self, path, registry):
+        self.signals = list(registry)
+        previous = read_snapshot(path, registry, skip=())
+
+        size = HEADER.size + SLOT.size * len(self.signals)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        self._slots = {}
+        for index, signal in enumerate(self.signals):
+            offset = HEADER.size + index * SLOT.size
+            self._slots[signal.name] = (offset, signal)
+            SLOT.pack_into(self._map, offset, signal.command, 0, 0, b'')
+        self._saved = {}
+        self.save(previous)
+
+    def save(self, values):
+        # `values` is {signal name: value}, signals missing from it keep their slot
+        changed = False
+        for name, value in values.items():
+            slot = self._slots.get(name)
+            if slot is None or self._saved.get(name) == value:
+                continue
+            offset, signal = slot
+            raw = bytes(bytearray(signal.encode(value)))
+            SLOT.pack_into(self._map, offset, signal.command, FLAG_VALID, len(raw), raw)
+            self._saved[name] = value
+            changed = True
+        if changed:
+            HEADER.pack_into(self._map, 0, MAGIC, VERSION, len(self.signals), time.time())
+            self._map.flush()
+
+    def close(self):
+        self._map.close()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+# Trip computer: values derived from the decoded speed, rpm, fuel_left and
+# distance samples, published like ECU signals:
+#   trip_consumption     l/100km since the start
+#   rolling_consumption  l/100km over the last `window` seconds
+#   average_speed        km/h since the start, while the engine runs
+#   range                km left at the rolling (else trip) consumption
+#
+# add() is called with every decoded sample, at the full poll rate, and does a
+# constant amount of work. Distance is the integrated speed, kept within one
+# odometer step of the `distance` signal. Fuel used is the drop of fuel_left
+# since the start plus every refill, so level noise cancels out instead of
+# adding up. The rolling window is a ring of one second buckets with running
+# sums; the outputs are recomputed when a bucket closes. fuel_left only moves in
+# 1/8 l steps, the window has to cover a litre or more for a steady figure.
+
+from array import array
+
+from decoders import registry
+from signalstore import SignalState
+
+# odometer resolution, km
+ODOMETER_STEP = registry['distance'].factor
+# a fuel_left rise above this is a refill, l
+REFILL = 3.0
+# speed samples further apart than this are not integrated (no data), s
+MAX_GAP = 2.0
+# minimum distance for a consumption figure, km
+MIN_DISTANCE = 0.5
+
+# output name -> deadband
+OUTPUTS = {
+    'trip_consumption': 0.05,
+    'rolling_consumption': 0.05,
+    'average_speed': 0.5,
+    'range': 1,
+}
+
+
+class RollingSum(object):
+    # Sum of the last `size` values pushed, O(1) per push. The sum is recomputed
+    # once per turn of the ring so that rounding errors do not accumulate.
+    def __init__(self, size):
+        self.values = array('d', [0.0]) * size
+        self.position = 0
+        self.sum = 0.0
+
+    def push(self, value):
+        values = self.values
+        position = self.position
+        self.sum += value - values[position]
+        values[position] = value
+        position += 1
+        if position == len(values):
+            position = 0
+            self.sum = sum(values)
+        self.position = position
+
+
+class TripComputer(object):
+    # `publish(name, value)` receives the outputs that changed by more than their
+    # deadband, e.g. SignalStore.set
+    def __init__(self, publish, window=900, bucket=1.0):
+        self.publish = publish
+        self.bucket = bucket
+        self.states = dict((name, SignalState(deadband)) for name, deadband in OUTPUTS.items())
+        self.handlers = {
+            'speed': self._speed,
+            'rpm': self._rpm,
+            'fuel_left': self._fuel_left,
+            'distance': self._distance,
+        }
+
+        self.distance = 0.0
+        self.driving_time = 0.0
+        self.fuel_used = 0.0
+        self.fuel_left = None
+        self._fuel_start = None
+        self._refilled = 0.0
+        self._odometer_start = None
+        self._speed_value = None
+        self._speed_time = None
+        self._engine_running = False
+
+        # per bucket distance and fuel used, summed over the window
+        self.window_distance = RollingSum(int(window / bucket))
+        self.window_fuel = RollingSum(int(window / bucket))
+        self._bucket_end = None
+        self._bucket_distance = 0.0
+        self._bucket_fuel = 0.0
+
+    def add(self, name, value, now):
+        handler = self.handlers.get(name)
+        if handler is not None:
+            handler(value, now)
+        if self._bucket_end is None:
+            self._bucket_end = now + self.bucket
+        elif now >= self._bucket_end:
+            self._close_bucket(now)
+
+    def _speed(self, value, now):
+        if self._speed_time is not None:
+            dt = now - self._speed_time
+            if dt <= MAX_GAP:
+                self.distance += (self._speed_value + value) * 0.5 * dt / 3600.0
+                if self._engine_running:
+                    self.driving_time += dt
+        self._speed_value = value
+        self._speed_time = now
+
+    def _rpm(self, value, now):
+        self._engine_running = value > 0
+
+    def _fuel_left(self, value, now):
+        if self._fuel_start is None:
+            self._fuel_start = value
+        elif value - self.fuel_left > REFILL:
+            self._refilled += value - self.fuel_left
+        self.fuel_left = value
+        self.fuel_used = max(0.0, self._fuel_start + self._refilled - value)
+
+    def _distance(self, value, now):
+        if self._odometer_start is None:
+            self._odometer_start = value
+        travelled = value - self._odometer_start
+        # the odometer only says the distance is within one step of `travelled`
+        self.distance = min(max(self.distance, travelled - ODOMETER_STEP), travelled + ODOMETER_STEP)
+
+    def _close_bucket(self, now):
+        self.window_distance.push(self.distance - self._bucket_distance)
+        self.window_fuel.push(self.fuel_used - self._bucket_fuel)
+        self._bucket_distance = self.distance
+        self._bucket_fuel = self.fuel_used
+        self._bucket_end = now + self.bucket
+
+        trip = self.consumption(self.fuel_used, self.distance)
+        rolling = self.consumption(self.window_fuel.sum, self.window_distance.sum)
+        self._output('trip_consumption', trip)
+        self._output('rolling_consumption', rolling)
+        if self.driving_time:
+            self._output('average_speed', round(self.distance / (self.driving_time / 3600.0), 1))
+        current = rolling if rolling else trip
+        if current and self.fuel_left is not None:
+            self._output('range', int(self.fuel_left / current * 100))
+
+    @staticmethod
+    def consumption(fuel, distance):
+        # l/100km, None until there is enough distance or any fuel used
+        if distance < MIN_DISTANCE or fuel <= 0:
+            return None
+        return round(fuel / distance * 100, 1)
+
+    def _output(self, name, value):
+        if value is not None and self.states[name].update(value, 0):
+            self.publish(name, value)
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from kivy.clock import Clock
+from kivy.core.image import Image as CoreImage
+from kivy.core.text import Label as CoreLabel
+from kivy.graphics import Fbo, ClearColor, ClearBuffers, PushMatrix, PopMatrix, Rotate, Rectangle
+from kivy.properties import NumericProperty
+from kivy.properties import ListProperty
+from kivy.properties import BoundedNumericProperty
+from kivy.properties import StringProperty
+from kivy.properties import OptionProperty
+from kivy.uix.scatter import Scatter
+from kivy.uix.widget import Widget
+
+import assets
+
+
+class CriticallyDampedFilter(object):
+    # Moves towards the latest sample like a critically damped spring, no overshoot.
+    # `smooth_time` is roughly the time to reach the target. A step covers at most
+    # `max_step` seconds, so a late frame does not turn into a jump.
+    def __init__(self, smooth_time=0.04, max_step=0.05):
+        self.smooth_time = smooth_time
+        self.max_step = max_step
+        self.value = None
+        self.target = None
+        self.velocity = 0.0
+        self._time = None
+
+    def add(self, value, timestamp):
+        if self.value is None or (self.velocity == 0.0 and self.value == self.target):
+            # at rest position() is not called, the movement starts from this sample
+            if self.value is None:
+                self.value = value
+            self._time = timestamp
+        self.target = value
+
+    def position(self, now):
+        # returns (value, settled)
+        if self.value is None:
+            return None, True
+        dt = min(now - self._time, self.max_step)
+        self._time = now
+        if dt <= 0:
+            return self.value, False
+
+        # closed form step of the damped spring (Game Programming Gems 4, 1.10)
+        omega = 2.0 / self.smooth_time
+        x = omega * dt
+        decay = 1.0 / (1.0 + x + 0.48 * x * x + 0.235 * x * x * x)
+        change = self.value - self.target
+        temp = (self.velocity + omega * change) * dt
+        self.velocity = (self.velocity - omega * temp) * decay
+        self.value = self.target + (change + temp) * decay
+
+        settled = abs(self.value - self.target) < 0.5 and abs(self.velocity) < 1.0
+        if settled:
+            self.value = self.target
+            self.velocity = 0.0
+        return self.value, settled
+
+
+class LinearFilter(object):
+    # Extrapolates along the slope of the last two samples, for at most one sample interval
+    def __init__(self):
+        self._samples = []
+
+    def add(self, value, timestamp):
+        self._samples = self._samples[-1:] + [(value, timestamp)]
+
+    def position(self, now):
+        if not self._samples:
+            return None, True
+        value, timestamp = self._samples[-1]
+        if len(self._samples) < 2:
+            return value, True
+        previous_value, previous_timestamp = self._samples[0]
+        interval = timestamp - previous_timestamp
+        if interval <= 0:
+            return value, True
+        ahead = min(now - timestamp, interval)
+        return value + (value - previous_value) / interval * ahead, ahead >= interval
+
+
+NEEDLE_FILTERS = {
+    'critically_damped': CriticallyDampedFilter,
+    'linear': LinearFilter,
+}
+
+
+class Gauge(Scatter):
+    # Dial and needle are two Rectangles on the gauge's own canvas. A value change only
+    # sets the angle of one Rotate instruction, looked up from a precomputed table.
+    # With `smoothing` set to one of NEEDLE_FILTERS the needle is moved once per frame
+    # towards the latest sample instead of jumping to it.
+    value = NumericProperty(10)  # BoundedNumericProperty(0, min=0, max=360, errorvalue=0)
+    size_gauge = BoundedNumericProperty(512, min=128, max=512, errorvalue=128)
+    size_text = NumericProperty(10)
+    file_gauge = StringProperty("")
+    file_needle = StringProperty(assets.source("arrow512.png"))
+    smoothing = OptionProperty('none', options=['none'] + sorted(NEEDLE_FILTERS))
+
+    # needle angle = zero_angle - degrees_per_unit * value
+    zero_angle = 112
+    degrees_per_unit = 0.028  # 1 rpm = 0.028 gr
+    max_value = 8000
+
+    def __init__(self, **kwargs):
+        super(Gauge, self).__init__(**kwargs)
+
+        self._angles = [self.zero_angle - self.degrees_per_unit * value for value in range(self.max_value + 1)]
+        self._sample_time = None
+        self._settled = True
+        self._filter = None
+        if self.smoothing != 'none':
+            self._filter = NEEDLE_FILTERS[self.smoothing]()
+            Clock.schedule_interval(self._animate, 0)
+
+        with self.canvas:
+            self._dial = Rectangle(source=self.file_gauge, size=(self.size_gauge, self.size_gauge))
+            PushMatrix()
+            self._rotate = Rotate(angle=0)
+            self._needle = Rectangle(source=self.file_needle)
+            PopMatrix()
+
+        # needle image keeps its aspect ratio inside the size_gauge square
+        needle_width, needle_height = self._needle.texture.size
+        scale = min(self.size_gauge / float(needle_width), self.size_gauge / float(needle_height))
+        self._needle.size = (needle_width * scale, needle_height * scale)
+
+        self.bind(pos=self._update)
+        self.bind(size=self._update)
+        self.bind(value=self._turn)
+        self._update()
+        self._turn()
+
+    def _update(self, *args):
+        self._dial.pos = self.pos
+        center_x = self.x + self.size_gauge / 2.0
+        center_y = self.y + self.size_gauge / 2.0
+        self._needle.pos = (center_x - self._needle.size[0] / 2.0, center_y - self._needle.size[1] / 2.0)
+        self._rotate.origin = (center_x, center_y)
+
+    def _angle(self, value):
+        index = int(value)
+        if index < 0:
+            index = 0
+        elif index > self.max_value:
+            index = self.max_value
+        return self._angles[index]
+
+    def sample(self, value, timestamp):
+        # new value together with the time it was received, used by the needle filter
+        self._sample_time = timestamp
+        self.value = value
+
+    def _turn(self, *args):
+        if self._filter is None:
+            self._rotate.angle = self._angle(self.value)
+        else:
+            self._filter.add(self.value, self._sample_time if self._sample_time is not None else time.monotonic())
+            self._sample_time = None
+            self._settled = False
+
+    def _animate(self, *args):
+        if self._settled:
+            return
+        value, self._settled = self._filter.position(time.monotonic())
+        if value is not None:
+            self._rotate.angle = self._angle(value)
+
+
+class Car(Scatter):
+    # Car body plus one Rectangle per door. A doors_states change only swaps the
+    # texture of the doors whose bit flipped, the widget tree is never touched.
+    car_image = StringProperty(assets.source("car362/car.png"))
+
+    driver_door_closed_image = StringProperty(assets.source("car362/driverClosedDoor.png"))
+    driver_door_opened_image = StringProperty(assets.source("car362/driverOpenedDoor.png"))
+
+    passenger_door_closed_image = StringProperty(assets.source("car362/passangerClosedDoor.png"))
+    passenger_door_opened_image = StringProperty(assets.source("car362/passangerOpenedDoor.png"))
+
+    left_door_closed_image = StringProperty(assets.source("car362/leftClosedDoor.png"))
+    left_door_opened_image = StringProperty(assets.source("car362/leftOpenedDoor.png"))
+
+    right_door_closed_image = StringProperty(assets.source("car362/rightClosedDoor.png"))
+    right_door_opened_image = StringProperty(assets.source("car362/rightOpenedDoor.png"))
+
+    doors_states = NumericProperty(0)
+
+    size = (286, 362)
+
+    # doors_states bit (set = closed) of each door
+    doors = (
+        (1, 'driver_door'),
+        (4, 'passenger_door'),
+        (16, 'left_door'),
+        (64, 'right_door'),
+    )
+
+    def __init__(self, **kwargs):
+        super(Car, self).__init__(**kwargs)
+
+        self._doors = []
+        with self.canvas:
+            Rectangle(source=self.car_image, size=self.size)
+            for bit, name in self.doors:
+                opened = CoreImage(getattr(self, name + '_opened_image')).texture
+                closed = CoreImage(getattr(self, name + '_closed_image')).texture
+                self._doors.append((bit, Rectangle(texture=opened, size=self.size), opened, closed))
+
+        # every door starts drawn opened
+        self._drawn_states = 0
+        self.bind(doors_states=self._update)
+        self._update()
+
+    def _update(self, *args):
+        changed = self.doors_states ^ self._drawn_states
+        if not changed:
+            return
+        for bit, rectangle, opened, closed in self._doors:
+            if changed & bit:
+                rectangle.texture = closed if self.doors_states & bit else opened
+        self._drawn_states = self.doors_states
+
+
+class BarGauge(Widget):
+    # Level bar drawn without a stencil: one Rectangle whose height and texture
+    # coordinates are cropped to the filled part of the scale image.
+    source = StringProperty("")
+    value = NumericProperty(0)
+    min_value = NumericProperty(0)
+    max_value = NumericProperty(100)
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('size_hint', (None, None))
+        super(BarGauge, self).__init__(**kwargs)
+
+        self._texture = CoreImage(self.source).texture
+        with self.canvas:
+            self._bar = Rectangle(texture=self._texture)
+
+        self.bind(pos=self._update, size=self._update, value=self._update,
+                  min_value=self._update, max_value=self._update)
+        self._update()
+
+    def _update(self, *args):
+        fraction = (self.value - self.min_value) / float(self.max_value - self.min_value)
+        if fraction < 0:
+            fraction = 0.0
+        elif fraction > 1:
+            fraction = 1.0
+
+        # scale image fitted into the widget like an Image widget would, anchored at the bottom of the image
+        texture_width, texture_height = self._texture.size
+        scale = min(self.width / float(texture_width), self.height / float(texture_height))
+        width = texture_width * scale
+        height = texture_height * scale
+        x = self.x + (self.width - width) / 2.0
+        y = self.y + (self.height - height) / 2.0
+
+        u0, v_bottom, u1, _, _, v_top, _, _ = self._texture.tex_coords
+        v = v_bottom + (v_top - v_bottom) * fraction
+        self._bar.pos = (x, y)
+        self._bar.size = (width, height * fraction)
+        self._bar.tex_coords = (u0, v_bottom, u1, v_bottom, u1, v, u0, v)
+
+
+GLYPHS = u'0123456789:.- '
+
+_glyph_sheets = {}
+
+
+def glyph_sheet(font_name, font_size):
+    # {char: texture region} of GLYPHS rendered once per font and size into one texture
+    key = (font_name, font_size)
+    sheet = _glyph_sheets.get(key)
+    if sheet is not None:
+        return sheet[1]
+
+    textures = []
+    for char in GLYPHS:
+        label = CoreLabel(text=char, font_name=font_name, font_size=font_size)
+        label.refresh()
+        textures.append(label.texture)
+
+    # one pixel of space between glyphs so filtering never bleeds into the neighbour
+    width = sum(texture.width + 1 for texture in textures)
+    height = max(texture.height for texture in textures)
+    fbo = Fbo(size=(width, height))
+    positions = []
+    with fbo:
+        ClearColor(0, 0, 0, 0)
+        ClearBuffers()
+        x = 0
+        for texture in textures:
+            Rectangle(texture=texture, pos=(x, 0), size=texture.size)
+            positions.append(x)
+            x += texture.width + 1
+    fbo.draw()
+
+    regions = {}
+    for char, texture, x in zip(GLYPHS, textures, positions):
+        regions[char] = fbo.texture.get_region(x, 0, texture.width, texture.height)
+    # the Fbo is kept so it can redraw the sheet after a GL context reload
+    _glyph_sheets[key] = (fbo, regions)
+    return regions
+
+
+class GlyphLabel(Widget):
+    # Numeric readout composed from a pre-rendered glyph sheet: a text change only points
+    # one Rectangle per character at its glyph, nothing is rasterized after the first use
+    # of a font and size. Lays the text out like a Label with valign 'bottom'; characters
+    # missing from GLYPHS are skipped.
+    text = StringProperty('')
+    font_name = StringProperty('Roboto')
+    font_size = NumericProperty(15)
+    halign = OptionProperty('left', options=['left', 'center', 'right'])
+    text_size = ListProperty([None, None])
+
+    def __init__(self, **kwargs):
+        super(GlyphLabel, self).__init__(**kwargs)
+
+        self._glyphs = glyph_sheet(self.font_name, self.font_size)
+        self._line_height = self._glyphs[u'0'].height
+        self._rectangles = []
+
+        self.bind(pos=self._update, size=self._update, text=self._update,
+                  halign=self._update, text_size=self._update)
+        self._update()
+
+    def _update(self, *args):
+        glyphs = [self._glyphs[char] for char in self.text if char in self._glyphs]
+        while len(self._rectangles) < len(glyphs):
+            rectangle = Rectangle()
+            self.canvas.add(rectangle)
+            self._rectangles.append(rectangle)
+
+        text_width = sum(glyph.width for glyph in glyphs)
+        box_width, box_height = self.text_size
+        if box_width is None:
+            box_width = text_width
+        if box_height is None:
+            box_height = self._line_height
+
+        # the text box is centered on the widget, like a Label's texture
+        x = self.center_x - box_width / 2.0
+        y = self.center_y - box_height / 2.0
+        if self.halign == 'right':
+            x += box_width - text_width
+        elif self.halign == 'center':
+            x += (box_width - text_width) / 2.0
+
+        for rectangle, glyph in zip(self._rectangles, glyphs):
+            rectangle.texture = glyph
+            rectangle.pos = (x, y)
+            rectangle.size = glyph.size
+            x += glyph.width
+        for rectangle in self._rectangles[len(glyphs):]:
+            rectangle.size = (0, 0)